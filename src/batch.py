@@ -0,0 +1,175 @@
+"""
+Пакетная проверка архива отчетов без Discord.
+
+Примеры:
+    python -m src.batch reports/ -o results.jsonl
+    python -m src.batch reports.jsonl -o results.csv --concurrency 8 --resume
+    python -m src.batch reports/ -o results.jsonl --base-url http://127.0.0.1:8080/v1
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator, Optional, Set, Tuple
+
+from src.bot.ai_client import AIClient
+from src.bot.attachments import AttachmentError, decode_text
+from src.bot.linter import ReportLinter, merge_recommendations
+from src.bot.routing import LatencyTracker
+from src.utils import logger
+from src.utils.config_loader import CONFIGS_BASE_DIR
+from src.utils.config_registry import registry
+
+logger = logger.get_logger("batch")
+
+CSV_FIELDS = ["id", "ok", "latency", "error", "recommendations", "corrected_report"]
+
+
+def read_reports(source: Path) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Отдает (id, текст, ошибка) из папки с .txt файлами или из JSONL-файла. Файл, который не удалось
+    прочитать ни в одной из кодировок attachments.encodings, попадает в результаты как непроверенный
+    """
+    if source.is_dir():
+        for path in sorted(source.rglob("*.txt")):
+            report_id = str(path.relative_to(source))
+            try:
+                yield report_id, decode_text(path.read_bytes(), registry.bot.attachments.encodings), None
+            except (AttachmentError, OSError) as e:
+                error = "файл не удалось прочитать как текст" if isinstance(e, AttachmentError) else str(e)
+                yield report_id, "", error
+        return
+
+    with source.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get("report") or record.get("text") or ""
+            yield str(record.get("id", line_no)), text, None
+
+
+def read_done_ids(output: Path) -> Set[str]:
+    """Идентификаторы успешно проверенных отчетов из существующего файла результатов"""
+    if not output.exists():
+        return set()
+    with output.open(encoding="utf-8", newline="") as f:
+        if output.suffix == ".csv":
+            return {row["id"] for row in csv.DictReader(f) if row["ok"] == "True"}
+        rows = (json.loads(line) for line in f if line.strip())
+        return {row["id"] for row in rows if row["ok"]}
+
+
+class ResultWriter:
+    """Пишет результаты по мере готовности, чтобы прерванный запуск можно было продолжить"""
+
+    def __init__(self, output: Path, append: bool):
+        self.is_csv = output.suffix == ".csv"
+        write_header = not (append and output.exists())
+        self.file = output.open("a" if append else "w", encoding="utf-8", newline="")
+        if self.is_csv:
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if write_header:
+                self.csv.writeheader()
+
+    def write(self, row: dict):
+        if self.is_csv:
+            self.csv.writerow({**row, "recommendations": json.dumps(row["recommendations"], ensure_ascii=False)})
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def run(args: argparse.Namespace):
+    done = read_done_ids(args.output) if args.resume else set()
+    reports = [report for report in read_reports(args.input) if report[0] not in done]
+    print(f"К проверке: {len(reports)} отчетов (пропущено уже готовых: {len(done)})")
+
+    client = AIClient(
+        env_path=CONFIGS_BASE_DIR / ".env",
+        report_type=args.prompt,
+        max_concurrent=args.concurrency,
+        base_url=args.base_url,
+    )
+    writer = ResultWriter(args.output, append=args.resume)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in reports:
+        queue.put_nowait(item)
+
+    linter = ReportLinter(min_words=registry.bot.linter.min_words) if args.lint else None
+    latencies = LatencyTracker(size=max(1, len(reports)))
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                report_id, text, read_error = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            row = {"id": report_id, "ok": True, "latency": 0.0, "error": "",
+                   "recommendations": [], "corrected_report": ""}
+            started = time.monotonic()
+            try:
+                if read_error:
+                    raise ValueError(read_error)
+                lint = linter.check(text) if linter else None
+                if lint and lint.blocked:
+                    # Непригодный текст не отправляем модели, исправленного варианта для него нет
+                    row["recommendations"] = [asdict(r) for r in lint.recommendations]
+                else:
+                    findings = lint.recommendations if lint else []
+                    result = await client.query(text, findings=findings)
+                    row["recommendations"] = [asdict(r) for r in
+                                              merge_recommendations(findings, result.recommendations)]
+                    row["corrected_report"] = result.corrected_report
+            except Exception as e:
+                errors += 1
+                row["ok"] = False
+                row["error"] = str(e)
+                logger.warning(f"Отчет {report_id} не проверен: {e}")
+            row["latency"] = round(time.monotonic() - started, 3)
+            latencies.observe(row["latency"])
+            writer.write(row)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        writer.close()
+        await client.close()
+    elapsed = time.monotonic() - started
+
+    total = len(latencies)
+    if not total:
+        return
+    print(f"Проверено: {total} за {elapsed:.1f} с ({total / elapsed:.2f} отчетов/с)")
+    print(f"Задержка p50: {latencies.percentile(0.5):.2f} с, p95: {latencies.percentile(0.95):.2f} с")
+    print(f"Ошибок: {errors} ({errors / total:.1%})")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description="Пакетная проверка отчетов")
+    parser.add_argument("input", type=Path, help="папка с .txt отчетами или JSONL с полями id и report")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="файл результатов (.jsonl или .csv)")
+    parser.add_argument("-c", "--concurrency", type=int, default=registry.bot.ai.max_concurrent,
+                        help="число одновременных проверок")
+    parser.add_argument("--prompt", default=registry.bot.bot.report_type, choices=sorted(registry.prompts),
+                        help="тип отчета (имя промпта из src/prompts)")
+    parser.add_argument("--base-url", default=registry.bot.ai.base_url, help="адрес OpenAI-совместимого API")
+    parser.add_argument("--no-lint", dest="lint", action="store_false",
+                        help="не выполнять локальную проверку перед запросом к модели")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить с места остановки, пропустив отчеты из файла результатов")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,156 @@
+"""
+Локальная замена API OpenRouter (chat completions) для нагрузочных тестов.
+
+Запуск отдельно:
+    python -m src.bench.fake_openrouter --port 8089 --latency 2.0 --rate-limit 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from aiohttp import web
+
+SAMPLE_RESULT = {
+    "recommendations": [
+        {
+            "criterion": "Стиль изложения",
+            "issues": [
+                "Перед именем подозреваемого не указана роль",
+                "Имя офицера указано кириллицей, требуется латиница",
+            ],
+        },
+        {
+            "criterion": "Дата и место происшествия",
+            "issues": ["Не указано время задержания"],
+        },
+        {
+            "criterion": "Результаты обыска и ареста",
+            "issues": ["Не указан серийный номер изъятого оружия"],
+        },
+    ],
+    "corrected_report": "ДАТА_И_ВРЕМЯ офицер Alexander Benga НОМЕР_ЭКИПАЖА задержал подозреваемого "
+                        "ИМЯ_ПОДОЗРЕВАЕМОГО у бара \"Nava\". При полном обыске был обнаружен пистолет "
+                        "СЕРИЙНЫЙ_НОМЕР_ПИСТОЛЕТА.",
+}
+
+
+@dataclass
+class FakeServerConfig:
+    latency_median: float = 1.0  # медиана задержки ответа, с
+    latency_sigma: float = 0.5  # разброс логнормального распределения
+    rate_limit: float = 0.0  # доля ответов 429
+    retry_after: float = 1.0
+    malformed: float = 0.0  # доля ответов с битым JSON
+    chunk_size: int = 40  # символов в одном чанке потокового ответа
+    latency_per_char: float = 0.0  # добавка к задержке на символ отчета: длинный отчет - длинный ответ
+
+
+class FakeOpenRouter:
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self.requests = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self._runner = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает base_url для AIClient"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "rate_limited": self.rate_limited, "malformed": self.malformed}
+
+    def _latency(self, report_length: int) -> float:
+        extra = report_length * self.config.latency_per_char
+        if self.config.latency_sigma <= 0:
+            return self.config.latency_median + extra
+        return random.lognormvariate(0, self.config.latency_sigma) * self.config.latency_median + extra
+
+    def _content(self) -> str:
+        content = json.dumps(SAMPLE_RESULT, ensure_ascii=False)
+        if random.random() < self.config.malformed:
+            self.malformed += 1
+            # Обрываем JSON посередине, как при сбое генерации
+            return "Вот результат проверки: " + content[:len(content) // 2]
+        return content
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+
+        if random.random() < self.config.rate_limit:
+            self.rate_limited += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit exceeded: free-models-per-min", "code": 429}},
+                status=429,
+                headers={"Retry-After": str(self.config.retry_after)},
+            )
+
+        base = {"id": f"gen-{uuid.uuid4().hex}", "created": int(time.time()), "model": body["model"]}
+        latency = self._latency(len(body["messages"][-1]["content"]))
+        content = self._content()
+        usage = {"prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 3,
+                 "completion_tokens": len(content) // 3}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        # Потоковый ответ: задержка распределяется по чанкам
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunks = [content[i:i + self.config.chunk_size] for i in range(0, len(content), self.config.chunk_size)]
+        for piece in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+
+async def _serve(args: argparse.Namespace):
+    server = FakeOpenRouter(FakeServerConfig(
+        latency_median=args.latency,
+        latency_sigma=args.sigma,
+        rate_limit=args.rate_limit,
+        malformed=args.malformed,
+    ))
+    base_url = await server.start(port=args.port)
+    print(f"Фейковый OpenRouter запущен: {base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m src.bench.fake_openrouter")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=1.0, help="медиана задержки, с")
+    parser.add_argument("--sigma", type=float, default=0.5, help="разброс логнормального распределения")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--malformed", type=float, default=0.0, help="доля ответов с битым JSON")
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,135 @@
+"""
+Сравнение разбора ответов модели: прежний разбор (жадная регулярка + Recommendation(**r))
+и response_parser (сбалансированный объект + схема pydantic-core).
+
+    python -m src.bench.parse                              # встроенный набор типичных ответов
+    python -m src.bench.parse corpus.jsonl                 # JSONL с полем response
+    python -m src.bench.parse --from-log src/logs/app.log  # "Сырой ответ" из лога в формате JSON (DEBUG)
+
+Корпус из лога собирается при logging.level: DEBUG и logging.json: true в logger_config.yaml.
+Ответы, обрезанные до logging.max_message_length, пропускаются: это не ответы модели, а их начало
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from src.bench.fake_openrouter import SAMPLE_RESULT
+from src.bot.ai_client import Recommendation, ReportCheckResult
+from src.bot.response_parser import parse_result
+from src.utils.logger import TRUNCATED_MARK
+
+RAW_RESPONSE_PREFIX = "Сырой ответ: "
+
+
+def builtin_corpus() -> List[str]:
+    """Ответ из FakeOpenRouter в вариантах, которые встречаются у бесплатных моделей"""
+    clean = json.dumps(SAMPLE_RESULT, ensure_ascii=False)
+    pretty = json.dumps(SAMPLE_RESULT, ensure_ascii=False, indent=2)
+    loose_issues = json.loads(clean)
+    loose_issues["recommendations"][2]["issues"] = loose_issues["recommendations"][2]["issues"][0]
+    extra_keys = json.loads(clean)
+    extra_keys["recommendations"][0]["severity"] = "high"
+    no_report = {"recommendations": SAMPLE_RESULT["recommendations"]}
+    return [
+        clean,
+        pretty,
+        f"```json\n{pretty}\n```",
+        f"Вот результат проверки:\n{pretty}\nЕсли нужно, могу пояснить {{любой}} пункт.",
+        f"Формат ответа {{recommendations, corrected_report}}:\n{clean}",
+        re.sub(r'"\n(\s*)([}\]])', r'",\n\1\2', pretty),  # висячие запятые
+        clean.replace("При полном обыске", "\nПри полном обыске"),  # перенос строки внутри строки
+        json.dumps(loose_issues, ensure_ascii=False),  # замечание строкой вместо списка
+        json.dumps(extra_keys, ensure_ascii=False),  # лишнее поле в рекомендации
+        json.dumps(no_report, ensure_ascii=False),  # нет corrected_report
+        "Вот результат проверки: " + clean[:len(clean) // 2],  # оборванный ответ
+    ]
+
+
+def load_corpus(path: Path) -> List[str]:
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line)["response"] for line in f if line.strip()]
+
+
+def load_log(path: Path) -> Tuple[List[str], int]:
+    """Сырые ответы из лога и число пропущенных обрезанных"""
+    responses = []
+    truncated = 0
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                message = json.loads(line)["message"]
+            except (ValueError, KeyError):
+                continue
+            if not message.startswith(RAW_RESPONSE_PREFIX):
+                continue
+            if TRUNCATED_MARK in message:
+                truncated += 1
+                continue
+            responses.append(message[len(RAW_RESPONSE_PREFIX):])
+    return responses, truncated
+
+
+def legacy_parse(text: str) -> ReportCheckResult:
+    match = re.search(r"\{.*}", text, re.DOTALL)
+    if not match:
+        raise ValueError("Не удалось найти JSON в переданном тексте")
+    data = json.loads(match.group(0))
+    return ReportCheckResult([Recommendation(**r) for r in data.get("recommendations", [])],
+                             data.get("corrected_report", ""))
+
+
+def current_parse(text: str) -> ReportCheckResult:
+    return ReportCheckResult.from_dict(parse_result(text))
+
+
+def measure(parse: Callable[[str], ReportCheckResult], corpus: List[str], repeat: int) -> Dict[str, float]:
+    failures = 0
+    for text in corpus:
+        try:
+            parse(text)
+        except (ValueError, TypeError):
+            failures += 1
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            try:
+                parse(text)
+            except (ValueError, TypeError):
+                pass
+    elapsed = time.perf_counter() - started
+    return {
+        "failures": failures,
+        "failure_rate": round(failures / len(corpus), 4),
+        "us_per_response": round(elapsed / (repeat * len(corpus)) * 1e6, 1),
+    }
+
+
+def main(args: argparse.Namespace):
+    if args.from_log:
+        corpus, truncated = load_log(args.from_log)
+        if truncated:
+            print(f"Пропущено обрезанных ответов: {truncated} (увеличьте logging.max_message_length)")
+    elif args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = builtin_corpus()
+    if not corpus:
+        raise SystemExit("Корпус пуст")
+
+    print(f"Ответов в корпусе: {len(corpus)}")
+    for name, parse in (("legacy", legacy_parse), ("response_parser", current_parse)):
+        result = measure(parse, corpus, args.repeat)
+        print(f"  {name}: ошибок {result['failures']} ({result['failure_rate']:.1%}), "
+              f"{result['us_per_response']} мкс на ответ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m src.bench.parse")
+    parser.add_argument("corpus", nargs="?", type=Path, help="JSONL с сырыми ответами модели в поле response")
+    parser.add_argument("--from-log", type=Path, help="лог в формате JSON с записями \"Сырой ответ\"")
+    parser.add_argument("-r", "--repeat", type=int, default=200, help="повторов для замера времени")
+    main(parser.parse_args())
@@ -0,0 +1,264 @@
+"""
+Нагрузочный прогон бота без Discord и без расхода квоты OpenRouter.
+
+Симулирует пользователей, которые нажимают "Начать проверку" и отправляют отчеты в ЛС,
+через handle_dm и SessionManager, а вместо OpenRouter использует FakeOpenRouter.
+
+    python -m src.bench.run                      # все сценарии
+    python -m src.bench.run -s peak -s streaming
+    python -m src.bench.run -o bench_results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.bench.fake_openrouter import FakeOpenRouter, FakeServerConfig
+from src.bot.routing import LatencyTracker
+
+# Без токена AIClient не создается, а реальный запрос в OpenRouter здесь не уходит
+os.environ.setdefault("OPENROUTER_TOKEN", "bench")
+
+SAMPLE_REPORT = (
+    "В субботу в службу спасения поступил звонок о мужчине, который ведет себя странно в баре Нава. "
+    "Он пытался убежать, когда приехали офицеры Александр Бенга и Маркус Каллоуэй. "
+    "Было начато преследование пешком до пляжа, где его поймали. "
+    "При обыске у него нашли нож, ствол и пакет с порошком."
+)
+
+LONG_REPORT = "\n\n".join(f"{SAMPLE_REPORT} (эпизод {i})" for i in range(1, 13))
+
+
+@dataclass
+class Scenario:
+    name: str
+    users: int
+    checks: int = 3
+    server: FakeServerConfig = field(default_factory=FakeServerConfig)
+    stream: bool = False
+    cache: bool = False
+    max_active: Optional[int] = None  # None - без ограничения сессий
+    report: str = SAMPLE_REPORT
+    sections: bool = False  # проверка отчета по частям через SectionChecker
+    workers: int = 0  # число процессов CheckWorkerPool, 0 - проверка в event loop бенчмарка
+    discord_latency: float = 0.05  # имитация задержки Discord API на отправку/редактирование
+
+
+SCENARIOS: Dict[str, Scenario] = {s.name: s for s in [
+    Scenario("baseline", users=10),
+    Scenario("peak", users=50),
+    Scenario("rate_limited", users=50, server=FakeServerConfig(rate_limit=0.2, retry_after=0.5)),
+    Scenario("malformed", users=20, server=FakeServerConfig(malformed=0.1)),
+    Scenario("streaming", users=50, stream=True),
+    Scenario("peak_workers", users=50, workers=2),
+    Scenario("admission_queue", users=30, max_active=5, server=FakeServerConfig(latency_median=0.3)),
+    Scenario("long_report", users=10, report=LONG_REPORT, server=FakeServerConfig(latency_per_char=0.002)),
+    Scenario("long_report_sections", users=10, report=LONG_REPORT, sections=True,
+             server=FakeServerConfig(latency_per_char=0.002)),
+]}
+
+
+# ---------------- ИМИТАЦИЯ DISCORD ----------------
+class FakeMessage:
+    def __init__(self, channel: "FakeDMChannel", author, content: str = "", **kwargs):
+        self.channel = channel
+        self.author = author
+        self.content = content or ""
+        self.attachments = []
+        self.embed = kwargs.get("embed")
+
+    async def edit(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.edits += 1
+        if content is not None:
+            self.content = content
+
+
+class FakeUser:
+    bot = False
+
+    def __init__(self, user_id: int, channel: "FakeDMChannel"):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.channel = channel
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeDMChannel:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent: List[FakeMessage] = []
+        self.edits = 0
+        self.bot_user = FakeUser(0, self)
+        self.bot_user.bot = True
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self, self.bot_user, content, **kwargs)
+        self.sent.append(message)
+        return message
+
+
+# ---------------- ИЗМЕРЕНИЯ ----------------
+async def monitor_loop_lag(samples: LatencyTracker, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.observe(max(0.0, loop.time() - started - interval))
+
+
+def summarize(tracker: LatencyTracker) -> dict:
+    return {p: round(tracker.percentile(q) or 0.0, 4) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+
+
+async def run_scenario(scenario: Scenario) -> dict:
+    from src.bot import handlers
+    from src.bot.ai_client import AIClient
+    from src.bot.incremental import IncrementalChecker
+    from src.bot.sections import SectionChecker
+    from src.bot.sessions_manager import SessionManager
+    from src.bot.workers import CheckWorkerPool
+    from src.utils.config_loader import CONFIGS_BASE_DIR
+    from src.utils.config_registry import registry
+
+    server = FakeOpenRouter(scenario.server)
+    base_url = await server.start()
+
+    # Подменяем зависимости обработчиков на изолированные для каждого сценария
+    registry.override({
+        "ai": {"stream": scenario.stream},
+        "session": {"max_active": scenario.max_active or scenario.users},
+    })
+    handlers.client = AIClient(env_path=CONFIGS_BASE_DIR / ".env", base_url=base_url)
+    section_checker = None
+    if scenario.sections:
+        sections_config = registry.bot.sections
+        section_checker = SectionChecker(handlers.client, sections_config.min_chars,
+                                         sections_config.target_chars, sections_config.max_sections)
+    handlers.report_checker = IncrementalChecker(handlers.client, section_checker,
+                                                 registry.bot.incremental.max_changed_ratio)
+    check_workers = None
+    if scenario.workers:
+        check_workers = CheckWorkerPool(scenario.workers, env_path=CONFIGS_BASE_DIR / ".env",
+                                        report_type=registry.bot.bot.report_type,
+                                        max_concurrent=registry.bot.ai.max_concurrent,
+                                        job_timeout=registry.bot.ai.http.total_timeout + registry.bot.workers.job_grace,
+                                        client_options={"base_url": base_url})
+        check_workers.start()
+        handlers.report_checker = check_workers
+    if not scenario.cache:
+        handlers.result_cache = None
+    session_manager = handlers.session_manager = SessionManager()
+
+    admitted: Dict[int, asyncio.Event] = {}
+
+    async def on_admit(session):
+        admitted[session.user_id].set()
+
+    session_manager.on_admit = on_admit
+
+    check_latency = LatencyTracker(size=scenario.users * scenario.checks)
+    admission_wait = LatencyTracker(size=scenario.users)
+    loop_lag = LatencyTracker(size=100_000)
+    failures = 0
+
+    async def simulate_user(user_id: int):
+        nonlocal failures
+        channel = FakeDMChannel(scenario.discord_latency)
+        user = FakeUser(user_id, channel)
+
+        started = time.monotonic()
+        session = await session_manager.create_session(user_id, dm_channel=user)
+        if session is None:
+            admitted[user_id] = asyncio.Event()
+            session_manager.enqueue(user_id, guild_id=None, dm_channel=user)
+            await admitted[user_id].wait()
+        admission_wait.observe(time.monotonic() - started)
+
+        for check in range(scenario.checks):
+            message = FakeMessage(channel, user, f"{scenario.report}\n(пользователь {user_id}, проверка {check})")
+            sent_before = len(channel.sent)
+            started = time.monotonic()
+            await handlers.handle_dm(message)
+            check_latency.observe(time.monotonic() - started)
+            if not any(m.embed for m in channel.sent[sent_before:]):
+                failures += 1
+
+    tracemalloc.start()
+    baseline_memory = tracemalloc.get_traced_memory()[0]
+    lag_task = asyncio.create_task(monitor_loop_lag(loop_lag))
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(simulate_user(i) for i in range(1, scenario.users + 1)))
+    finally:
+        elapsed = time.monotonic() - started
+        lag_task.cancel()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if check_workers:
+            await check_workers.close()
+        await handlers.client.close()
+        await server.stop()
+
+    total = scenario.users * scenario.checks
+    return {
+        "scenario": {**asdict(scenario), "server": asdict(scenario.server)},
+        "elapsed": round(elapsed, 3),
+        "checks": total,
+        "failures": failures,
+        "error_rate": round(failures / total, 4),
+        "throughput": round(total / elapsed, 3),
+        "check_latency": summarize(check_latency),
+        "admission_wait": summarize(admission_wait),
+        "loop_lag": {**summarize(loop_lag), "max": round(max(loop_lag.samples, default=0.0), 4)},
+        "memory_per_session_kb": round((peak_memory - baseline_memory) / scenario.users / 1024, 1),
+        "upstream": server.stats(),
+        "client": handlers.client.stats(),
+        "workers": check_workers.stats() if check_workers else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args: argparse.Namespace):
+    names = args.scenario or list(SCENARIOS)
+    commit = git_commit()
+    results = {"commit": commit, "timestamp": datetime.now().isoformat(timespec="seconds"), "scenarios": {}}
+
+    for name in names:
+        print(f"Сценарий {name}...")
+        result = await run_scenario(SCENARIOS[name])
+        results["scenarios"][name] = result
+        print(f"  {result['checks']} проверок за {result['elapsed']} с, {result['throughput']} проверок/с, "
+              f"p95 {result['check_latency']['p95']} с, ошибок {result['error_rate']:.1%}, "
+              f"лаг цикла p99 {result['loop_lag']['p99'] * 1000:.1f} мс")
+
+    output = args.output or Path("bench_results") / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m src.bench.run")
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="сценарий для прогона (можно указать несколько раз)")
+    parser.add_argument("-o", "--output", type=Path, help="файл для сохранения результатов в JSON")
+    asyncio.run(main(parser.parse_args()))
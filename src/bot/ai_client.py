@@ -1,16 +1,25 @@
 import asyncio
+import email.utils
+import hashlib
+import json
 import os
-from dataclasses import dataclass
+import random
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 
 import httpx
 import openai
 from dotenv import load_dotenv
 
+from src.bot import response_parser
+from src.bot.limiter import AdaptiveLimiter
+from src.bot.routing import ModelRoute
 from src.utils import logger
+from src.utils import metrics
 from src.utils import utils
-from src.utils.config_loader import PROMPTS_BASE_DIR
+from src.utils.config_registry import registry
 
 logger = logger.get_logger("ai_client")
 
@@ -26,75 +35,491 @@ class ReportCheckResult:
     recommendations: List[Recommendation]
     corrected_report: str
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReportCheckResult":
+        recommendations = [Recommendation(**r) for r in data.get("recommendations", [])]
+        corrected = data.get("corrected_report", "")
+        return cls(recommendations, corrected)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Достает задержку из заголовка Retry-After (секунды или HTTP-дата)"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _log_usage(model: str, usage):
+    """Фактический расход токенов по данным API"""
+    if usage:
+        metrics.tokens_total.inc(usage.prompt_tokens, kind="prompt", model=model)
+        metrics.tokens_total.inc(usage.completion_tokens, kind="completion", model=model)
+        logger.info(f"Модель {model}: prompt_tokens={usage.prompt_tokens}, "
+                    f"completion_tokens={usage.completion_tokens}")
+
+
+def _parse_result(parse: Callable[[], dict]) -> ReportCheckResult:
+    with metrics.span("parse"):
+        try:
+            return ReportCheckResult.from_dict(parse())
+        except (ValueError, TypeError):
+            metrics.parse_failures_total.inc()
+            raise
+
+
+@dataclass
+class _Flight:
+    """Выполняющийся запрос к API, число ожидающих его результата и подписчики на потоковые рекомендации"""
+    task: Optional[asyncio.Task] = None
+    waiters: int = 0
+    listeners: List[Callable[[Recommendation], None]] = field(default_factory=list)
+    emitted: List[Recommendation] = field(default_factory=list)
+
+    def emit(self, recommendation: Recommendation):
+        self.emitted.append(recommendation)
+        for listener in list(self.listeners):
+            listener(recommendation)
+
 
 class AIClient:
-    BASE_RULES_PROMPT = (PROMPTS_BASE_DIR / "base_rules.txt").read_text(encoding="utf-8").strip()
+    FINDINGS_HEADER = ("Замечания, уже найденные автоматической проверкой. Не повторяй их в recommendations, "
+                       "но учти в corrected_report:")
 
     def __init__(
             self,
             env_path: Path,
-            prompt_path: Path,
-            model_name: str = "z-ai/glm-4.5-air:free",
-            max_concurrent: int = 10,
+            report_type: str = "arrest_report",
+            models: Optional[List[dict]] = None,
+            max_concurrent: Optional[int] = None,
+            base_url: Optional[str] = None,
     ):
+        # Снимок настроек на момент создания: учитывает registry.override, перезагрузка клиент не пересоздает
+        ai_config = registry.bot.ai
+        max_concurrent = max_concurrent or ai_config.max_concurrent
+        base_url = base_url or ai_config.base_url
         # Загружаем токен
         load_dotenv(dotenv_path=env_path)
         api_key = os.getenv("OPENROUTER_TOKEN")
         if not api_key:
             raise ValueError("OPENROUTER_TOKEN не найден в .env")
 
-        self.client = openai.OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+        http_config = ai_config.http
+        self.timeout = httpx.Timeout(
+            connect=http_config.connect_timeout,
+            read=http_config.read_timeout,
+            write=http_config.connect_timeout,
+            pool=http_config.connect_timeout,
+        )
+        self.total_timeout = http_config.total_timeout
+
+        # Асинхронный клиент с пулом соединений и keep-alive
+        self.client = openai.AsyncOpenAI(
+            base_url=base_url,
             api_key=api_key,
-            http_client=httpx.Client()
+            timeout=self.timeout,
+            max_retries=0,  # Повторы выполняются в _with_retry с учетом окна ограничителя
+            http_client=httpx.AsyncClient(
+                http2=http_config.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=http_config.max_connections,
+                    max_keepalive_connections=http_config.max_keepalive_connections,
+                    keepalive_expiry=http_config.keepalive_expiry,
+                ),
+            ),
         )
 
-        # Загружаем промпт
-        if not prompt_path.exists():
-            raise FileNotFoundError(f"Файл промта не найден: {prompt_path}")
+        # Промпт берется из реестра при каждом запросе, чтобы подхватывать перезагрузку
+        registry.role_prompt(report_type)
+        self.report_type = report_type
+
+        # Цепочка моделей: первая - основная, остальные для хеджирования и фолбэка
+        self.models = [ModelRoute(m["name"], m["timeout"], m.get("response_format"))
+                       for m in (models or ai_config.models)]
+        self.model_name = self.models[0].name
+        hedge_config = ai_config.hedge
+        self.hedge_enabled = hedge_config.enabled and len(self.models) > 1
+        self.hedge_percentile = hedge_config.percentile
+        self.hedge_min_samples = hedge_config.min_samples
+        self.hedge_default_delay = hedge_config.default_delay
+        self.hedge_min_delay = hedge_config.min_delay
+        self.hedged = 0
+        self.fallbacks = 0
 
-        self.role_prompt = (
-                prompt_path.read_text(encoding="utf-8").strip()
-                + f"\n\n---\n\n{self.BASE_RULES_PROMPT}"
+        limiter_config = ai_config.limiter
+        self.limiter = AdaptiveLimiter(
+            initial=limiter_config.initial,
+            min_limit=limiter_config.min,
+            max_limit=max_concurrent,
+            latency_threshold=limiter_config.latency_threshold,
         )
+        self.retry_attempts = ai_config.retry.max_attempts
+        self.retry_base_delay = ai_config.retry.base_delay
+        self.retry_max_delay = ai_config.retry.max_delay
+        self._in_flight: Dict[str, _Flight] = {}
+        self.coalesced = 0
+
+        logger.info(f"AIClient инициализирован: модели={[m.name for m in self.models]}, "
+                    f"max_concurrent={max_concurrent}")
 
-        self.model_name = model_name
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+    async def close(self):
+        """Закрывает пул соединений с API"""
+        await self.client.close()
+        logger.info("AIClient закрыт")
 
-        logger.info(f"AIClient инициализирован: модель={model_name}, max_concurrent={max_concurrent}")
+    async def _create(self, route: ModelRoute, **params):
+        """
+        Запрос к API с структурированным выводом, если он задан для модели. Если провайдер отклоняет
+        запрос (400), а без response_format он проходит - структурированный вывод для модели отключается
+        """
+        response_format = response_parser.RESPONSE_FORMATS.get(route.response_format)
+        if not response_format:
+            return await self.client.chat.completions.create(model=route.name, **params)
+        try:
+            return await self.client.chat.completions.create(model=route.name, response_format=response_format,
+                                                             **params)
+        except openai.BadRequestError as e:
+            response = await self.client.chat.completions.create(model=route.name, **params)
+            logger.warning(f"Модель {route.name} не поддерживает response_format={route.response_format}, "
+                           f"он отключен: {e}")
+            route.response_format = None
+            return response
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Пауза перед повтором: Retry-After от API или экспоненциальная задержка с джиттером"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))
+
+    async def _with_retry(self, attempt: Callable[[], Awaitable[ReportCheckResult]],
+                          timeout: float) -> ReportCheckResult:
+        """
+        Выполняет запрос в окне адаптивного ограничителя, повторяя его при 429, 5xx и сетевых
+        ошибках, пока укладывается в дедлайн timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        for attempt_no in range(1, self.retry_attempts + 1):
+            with metrics.span("queue_wait"):
+                started_at = await asyncio.wait_for(self.limiter.acquire(), timeout=deadline - loop.time())
+            try:
+                result = await asyncio.wait_for(attempt(), timeout=deadline - loop.time())
+            except openai.RateLimitError as e:
+                self.limiter.release(started_at, rate_limited=True)
+                error = e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                self.limiter.release(started_at)
+                error = e
+            except BaseException:
+                self.limiter.release(started_at)
+                raise
+            else:
+                self.limiter.release(started_at, latency=loop.time() - started_at)
+                return result
 
-    def _sync_query(self, messages: List[dict]):
-        """Синхронный запрос к API OpenRouter"""
-        return self.client.chat.completions.create(
-            model=self.model_name,
+            delay = self._retry_delay(error, attempt_no)
+            if attempt_no == self.retry_attempts or loop.time() + delay >= deadline:
+                raise error
+            logger.warning(f"Попытка {attempt_no} не удалась ({error}), повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+    async def _stream(self, route: ModelRoute, messages: List[dict], parser: utils.IncrementalJSONParser,
+                      on_recommendation: Callable[[Recommendation], None]):
+        """Читает поток токенов и передает каждую готовую рекомендацию в колбэк"""
+        stream = await self._create(
+            route,
             messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    _log_usage(route.name, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                for item in parser.feed(delta or ""):
+                    # Некорректный элемент не показываем, он будет обнаружен при финальном разборе
+                    recommendation = response_parser.parse_recommendation(item)
+                    if recommendation:
+                        on_recommendation(Recommendation(**recommendation))
+        finally:
+            # При отмене проигравшего хеджированного запроса сразу освобождаем соединение
+            await stream.close()
+
+    async def _run_route(self, route: ModelRoute, attempt: Callable[[], Awaitable[ReportCheckResult]]):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            result = await self._with_retry(attempt, timeout=route.timeout)
+        except asyncio.CancelledError:
+            # Проигравший запрос учитываем нижней оценкой, иначе перцентили медленной модели занижаются
+            route.latency.observe(loop.time() - started)
+            raise
+        route.latency.observe(loop.time() - started)
+        return result
 
-    async def query(self, user_message: str, history: Optional[List[dict]] = None) -> ReportCheckResult:
+    async def _route(self, make_attempt: Callable[[ModelRoute], Callable[[], Awaitable[ReportCheckResult]]]):
         """
-        Асинхронный запрос к модели с логированием и поддержкой контекста (истории диалога)
+        Опрашивает цепочку моделей: если основная долго не отвечает, параллельно отправляет
+        дублирующий запрос в следующую, при ошибке или невалидном JSON переходит к следующей.
+        Побеждает первый валидный результат, остальные запросы отменяются
         """
-        async with self.semaphore:
-            logger.debug(f"Отправка запроса к модели ({self.model_name})")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.total_timeout
+        pending: Dict[asyncio.Task, tuple] = {}
+        next_index = 0
+        last_error: Optional[BaseException] = None
 
-            # Формируем историю сообщений
-            messages = [{"role": "system", "content": self.role_prompt}]
-            if history:
-                messages.extend(history)
-            messages.append({"role": "user", "content": user_message})
+        def launch():
+            nonlocal next_index
+            route = self.models[next_index]
+            next_index += 1
+            task = asyncio.create_task(self._run_route(route, make_attempt(route)))
+            pending[task] = (route, loop.time())
+            return route
 
-            logger.debug(f"Отправляется {len(messages)} сообщений в модель")
+        launch()
+        try:
+            while pending:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    raise asyncio.TimeoutError("превышено общее время ожидания ответа моделей")
 
-            try:
-                response = await asyncio.to_thread(self._sync_query, messages)
+                hedge = self.hedge_enabled and len(pending) == 1 and next_index < len(self.models)
+                if hedge:
+                    route, started = next(iter(pending.values()))
+                    delay = route.hedge_delay(self.hedge_percentile, self.hedge_min_samples,
+                                              self.hedge_default_delay, self.hedge_min_delay)
+                    timeout = min(timeout, max(0.0, started + delay - loop.time()))
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge:
+                        self.hedged += 1
+                        hedge_route = launch()
+                        logger.info(f"Модель {route.name} не ответила за {delay:.1f} с, "
+                                    f"отправлен дублирующий запрос в {hedge_route.name}")
+                    continue
+
+                result = None
+                for task in done:
+                    route, _ = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        result = result or task.result()
+                    else:
+                        last_error = error
+                        route.failures += 1
+                        logger.warning(f"Модель {route.name} не вернула результат: {error}")
+                if result is not None:
+                    return result
+
+                if not pending and next_index < len(self.models):
+                    self.fallbacks += 1
+                    fallback_route = launch()
+                    logger.info(f"Переход к следующей модели: {fallback_route.name}")
+
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def role_prompt(self, report_type: Optional[str] = None) -> str:
+        """Актуальный системный промпт для типа отчета (по умолчанию - report_type клиента)"""
+        return registry.role_prompt(report_type or self.report_type)
+
+    def _build_messages(self, user_message: str, history: Optional[List[dict]], report_type: Optional[str],
+                        findings: Optional[List[Recommendation]]) -> List[dict]:
+        """Формирует историю сообщений для модели"""
+        messages = [{"role": "system", "content": self.role_prompt(report_type)}]
+        if history:
+            messages.extend(history)
+        if findings:
+            lines = [f"- {rec.criterion}: {'; '.join(rec.issues)}" for rec in findings]
+            user_message = "\n".join([user_message, "", "---", self.FINDINGS_HEADER, *lines])
+        messages.append({"role": "user", "content": user_message})
+        logger.info("Оценка размера запроса: ~%d токенов, сообщений в истории: %d",
+                    utils.estimate_messages_tokens(messages), len(history or []))
+        return messages
+
+    async def _query_once(self, messages: List[dict]) -> ReportCheckResult:
+        logger.debug("Отправка запроса к модели (%s)", self.model_name)
+        logger.debug("Отправляется %d сообщений в модель", len(messages))
+
+        def make_attempt(route: ModelRoute):
+            async def attempt() -> ReportCheckResult:
+                with metrics.span("upstream"):
+                    response = await self._create(route, messages=messages)
                 content = response.choices[0].message.content
-                logger.debug("Ответ от модели получен")
-                logger.debug(f"Сырой ответ: {content}")
+                logger.debug("Ответ от модели %s получен", route.name)
+                _log_usage(route.name, response.usage)
+                logger.debug("Сырой ответ: %s", content)
+
+                return _parse_result(lambda: response_parser.parse_result(content or ""))
+
+            return attempt
+
+        try:
+            return await self._route(make_attempt)
+        except Exception as e:
+            raise RuntimeError(f"Не удалось выполнить запрос: {e}")
+
+    async def _query_stream_once(self, messages: List[dict],
+                                 on_recommendation: Callable[[Recommendation], None]) -> ReportCheckResult:
+        logger.debug("Отправка потокового запроса к модели (%s)", self.model_name)
+        logger.debug("Отправляется %d сообщений в модель", len(messages))
+
+        # Рекомендации показываем только от модели, которая начала отдавать их первой
+        owner: List[ModelRoute] = []
+
+        def make_attempt(route: ModelRoute):
+            emitted = 0
+
+            async def attempt() -> ReportCheckResult:
+                parser = utils.IncrementalJSONParser()
+                seen = 0
+
+                def emit(recommendation: Recommendation):
+                    # После повтора не отправляем повторно уже показанные рекомендации
+                    nonlocal emitted, seen
+                    seen += 1
+                    if seen <= emitted:
+                        return
+                    emitted = seen
+                    if not owner:
+                        owner.append(route)
+                    if owner[0] is route:
+                        on_recommendation(recommendation)
+
+                with metrics.span("upstream"):
+                    await self._stream(route, messages, parser, emit)
+                logger.debug("Поток ответа от модели %s завершен", route.name)
+                logger.debug("Сырой ответ: %s", parser.text)
+
+                return _parse_result(lambda: response_parser.parse_result(parser.text))
+
+            return attempt
 
-                data = utils.extract_json(content)
-                recommendations = [Recommendation(**r) for r in data.get("recommendations", [])]
-                corrected = data.get("corrected_report", "")
-                return ReportCheckResult(recommendations, corrected)
+        try:
+            return await self._route(make_attempt)
+        except Exception as e:
+            raise RuntimeError(f"Не удалось выполнить запрос: {e}")
 
-            except Exception as e:
-                raise RuntimeError(f"Не удалось выполнить запрос: {e}")
+    def _flight_key(self, messages: List[dict], stream: bool) -> str:
+        # Потоковый запрос не объединяется с обычным: у обычного нет рекомендаций по ходу ответа
+        payload = json.dumps([self.model_name, stream, messages], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _finish_flight(self, key: str, flight: _Flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        # Забираем исключение, даже если все ожидающие уже отменены
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    async def _coalesced(self, messages: List[dict], stream: bool,
+                         on_recommendation: Optional[Callable[[Recommendation], None]]) -> ReportCheckResult:
+        """
+        Объединяет одновременные одинаковые запросы в один вызов API.
+        Отмена одного из ожидающих не отменяет общий запрос, а уход последнего - отменяет
+        """
+        key = self._flight_key(messages, stream)
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = _Flight()
+            if stream:
+                flight.task = asyncio.create_task(self._query_stream_once(messages, flight.emit))
+            else:
+                flight.task = asyncio.create_task(self._query_once(messages))
+            flight.task.add_done_callback(lambda _: self._finish_flight(key, flight))
+            self._in_flight[key] = flight
+        else:
+            self.coalesced += 1
+            logger.info(f"Запрос объединен с уже выполняющимся (всего объединено: {self.coalesced})")
+
+        if on_recommendation:
+            for rec in flight.emitted:
+                on_recommendation(rec)
+            flight.listeners.append(on_recommendation)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_recommendation:
+                flight.listeners.remove(on_recommendation)
+            if not flight.waiters and not flight.task.done():
+                # Результат больше никому не нужен: не расходуем квоту на брошенный запрос
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "models": {
+                m.name: {
+                    "p50": m.latency.percentile(0.5),
+                    "p90": m.latency.percentile(0.9),
+                    "failures": m.failures,
+                }
+                for m in self.models
+            },
+            **self.limiter.stats(),
+        }
+
+    async def query(self, user_message: str, history: Optional[List[dict]] = None,
+                    report_type: Optional[str] = None,
+                    findings: Optional[List[Recommendation]] = None) -> ReportCheckResult:
+        """
+        Асинхронный запрос к модели с логированием и поддержкой контекста (истории диалога).
+        findings - замечания локальной проверки, которые модели не нужно искать повторно
+        """
+        messages = self._build_messages(user_message, history, report_type, findings)
+        return await self._coalesced(messages, stream=False, on_recommendation=None)
+
+    async def query_stream(
+            self,
+            user_message: str,
+            history: Optional[List[dict]] = None,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None,
+            report_type: Optional[str] = None,
+            findings: Optional[List[Recommendation]] = None,
+    ) -> ReportCheckResult:
+        """
+        Потоковый запрос к модели: рекомендации передаются в on_recommendation по мере генерации,
+        полный ответ валидируется после окончания потока
+        """
+        messages = self._build_messages(user_message, history, report_type, findings)
+        return await self._coalesced(messages, stream=True, on_recommendation=on_recommendation)
+
+    async def check(
+            self,
+            user_message: str,
+            history: Optional[List[dict]] = None,
+            report_type: Optional[str] = None,
+            findings: Optional[List[Recommendation]] = None,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None,
+    ) -> ReportCheckResult:
+        """Потоковый запрос, если передан on_recommendation, иначе обычный"""
+        messages = self._build_messages(user_message, history, report_type, findings)
+        return await self._coalesced(messages, stream=on_recommendation is not None,
+                                     on_recommendation=on_recommendation)
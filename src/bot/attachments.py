@@ -0,0 +1,201 @@
+import asyncio
+import codecs
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import aiohttp
+import discord
+
+from src.utils import logger
+
+logger = logger.get_logger("attachments")
+
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+_SPACE_RE = re.compile(r"[^\S\n]+")  # любые пробельные символы, кроме перевода строки
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0e-\x1b\x7f]")
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+class AttachmentError(Exception):
+    """Вложение отклонено до отправки модели: message_key - ключ сообщения из registry.messages"""
+
+    def __init__(self, message_key: str, **params):
+        super().__init__(message_key)
+        self.message_key = message_key
+        self.params = params
+
+
+class _Normalizer:
+    """
+    Нормализация текста по мере поступления: единые переводы строк, один пробел между словами,
+    не больше одной пустой строки между абзацами
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.chars = 0
+        self.control_chars = 0
+        self._tail = ""  # незавершенная строка из предыдущего куска
+        self._blank = False
+
+    def feed(self, text: str):
+        if not text:
+            return
+        self.chars += len(text)
+        self.control_chars += len(_CONTROL_RE.findall(text))
+        text = self._tail + text
+        # \r в конце куска может оказаться первой половиной \r\n
+        cut = len(text) - 1 if text.endswith("\r") else len(text)
+        lines = _LINE_BREAK_RE.split(text[:cut])
+        self._tail = lines.pop() + text[cut:]
+        for line in lines:
+            self._add_line(line)
+
+    def _add_line(self, line: str):
+        line = _SPACE_RE.sub(" ", line).strip()
+        if not line:
+            self._blank = bool(self.lines)
+            return
+        if self._blank:
+            self.lines.append("")
+            self._blank = False
+        self.lines.append(line)
+
+    def finish(self) -> str:
+        self._add_line(self._tail.rstrip("\r"))
+        self._tail = ""
+        return "\n".join(self.lines)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация отчета, присланного сообщением, по тем же правилам, что и файла"""
+    normalizer = _Normalizer()
+    normalizer.feed(text)
+    return normalizer.finish()
+
+
+class _Decoder:
+    """
+    Инкрементальное декодирование с нормализацией. Кодировка определяется по BOM, а если байты
+    не подходят под текущую кодировку - прочитанное перекодируется следующей из списка
+    """
+
+    def __init__(self, encodings: Sequence[str]):
+        self._encodings = list(encodings)
+        self._raw = bytearray()  # ограничен max_bytes, нужен для перекодирования
+        self._start(self._encodings.pop(0))
+
+    def _start(self, encoding: str):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.normalizer = _Normalizer()
+
+    def feed(self, chunk: bytes, final: bool = False):
+        if not self._raw:
+            for bom, encoding in _BOMS:
+                if chunk.startswith(bom):
+                    self._start(encoding)
+                    break
+        self._raw += chunk
+        while True:
+            try:
+                self.normalizer.feed(self._decoder.decode(chunk, final))
+                return
+            except UnicodeDecodeError:
+                if not self._encodings:
+                    raise AttachmentError("err_file_unreadable")
+                self._start(self._encodings.pop(0))
+                chunk = bytes(self._raw)
+
+    def finish(self) -> str:
+        self.feed(b"", final=True)
+        # Двоичный файл с расширением .txt: однобайтовая кодировка "прочитает" его, но это не текст
+        if self.normalizer.control_chars > self.normalizer.chars // 100:
+            raise AttachmentError("err_file_unreadable")
+        return self.normalizer.finish()
+
+
+def decode_text(data: bytes, encodings: Sequence[str]) -> str:
+    """Декодирование и нормализация файла целиком по тем же правилам, что и вложения"""
+    decoder = _Decoder(encodings)
+    decoder.feed(data)
+    return decoder.finish()
+
+
+@dataclass
+class _Budget:
+    """Сколько байт еще можно скачать на все вложения сообщения"""
+    remaining: int
+    limit: int
+
+    def take(self, size: int):
+        self.remaining -= size
+        if self.remaining < 0:
+            raise AttachmentError("err_file_too_large", limit=self.limit // 1024)
+
+
+class AttachmentReader:
+    """
+    Чтение .txt вложений: размер проверяется до скачивания, файлы скачиваются одновременно и по частям,
+    декодируются и нормализуются на лету. Все, что не подходит, отклоняется до обращения к модели
+    """
+
+    def __init__(self, max_bytes: int, max_files: int, chunk_size: int, timeout: float, encodings: Sequence[str]):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.chunk_size = chunk_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.encodings = list(encodings)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _http(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def read(self, attachments: Sequence[discord.Attachment]) -> str:
+        """Текст всех вложений по порядку, через пустую строку"""
+        if len(attachments) > self.max_files:
+            raise AttachmentError("err_too_many_files", limit=self.max_files)
+        if not all(a.filename.lower().endswith(".txt") for a in attachments):
+            raise AttachmentError("err_wrong_format")
+        if sum(a.size for a in attachments) > self.max_bytes:
+            raise AttachmentError("err_file_too_large", limit=self.max_bytes // 1024)
+
+        budget = _Budget(self.max_bytes, self.max_bytes)
+        tasks = [asyncio.create_task(self._read_one(a, budget)) for a in attachments]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            # Одно отклоненное вложение отклоняет все сообщение, остальные не докачиваем
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return "\n\n".join(text for text in texts if text)
+
+    async def _read_one(self, attachment: discord.Attachment, budget: _Budget) -> str:
+        decoder = _Decoder(self.encodings)
+        try:
+            async with self._http().get(attachment.url) as response:
+                response.raise_for_status()
+                # Размер проверяется и при скачивании: attachment.size мог не совпасть с содержимым
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    budget.take(len(chunk))
+                    decoder.feed(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не удалось скачать вложение {attachment.filename}: {e}")
+            raise AttachmentError("err_file_unreadable")
+        text = decoder.finish()
+        if decoder.encoding not in ("utf-8", "utf-8-sig"):
+            logger.info(f"Вложение {attachment.filename} прочитано в кодировке {decoder.encoding}")
+        return text
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
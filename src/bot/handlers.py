@@ -1,109 +1,302 @@
-import io
+import asyncio
+import hashlib
+import json
+import time
+
+from typing import Optional
 
 import discord
 from discord.ext import commands
 
-from src.bot.ai_client import AIClient
+from src.bot.ai_client import AIClient, ReportCheckResult
+from src.bot.attachments import AttachmentError, AttachmentReader, normalize_text
+from src.bot.history import HistoryBudget, summarize_result
+from src.bot.incremental import IncrementalChecker, build_blocks
+from src.bot.linter import LintResult, ReportLinter, merge_recommendations
+from src.bot.result_cache import ResultCache
+from src.bot.sections import CheckedSection, SectionChecker
+from src.bot.session_store import SessionStore
+from src.bot.sessions import UserSession
 from src.bot.sessions_manager import SessionManager
-from src.bot.views import ReportView
+from src.bot.views import ReportView, StreamingProgress
+from src.bot.workers import CheckWorkerPool
 from src.utils import logger
-from src.utils.config_loader import messages_config, bot_config, CONFIGS_BASE_DIR, PROMPTS_BASE_DIR
+from src.utils import metrics
+from src.utils.logger import new_request_id
+from src.utils.config_loader import CONFIGS_BASE_DIR, SRC_BASE_DIR
+from src.utils.config_registry import ConfigSnapshot, registry
 
 logger = logger.get_logger("handlers")
 
-session_manager = SessionManager()
+session_store = None
+if registry.bot.persistence.enabled:
+    session_store = SessionStore(
+        db_path=SRC_BASE_DIR / registry.bot.persistence.path,
+        flush_interval=registry.bot.persistence.flush_interval,
+    )
+
+session_manager = SessionManager(store=session_store)
+history_budget = HistoryBudget(max_tokens=registry.bot.history.max_tokens)
+report_linter = ReportLinter(min_words=registry.bot.linter.min_words) if registry.bot.linter.enabled else None
+attachment_reader = AttachmentReader(
+    max_bytes=registry.bot.attachments.max_bytes,
+    max_files=registry.bot.attachments.max_files,
+    chunk_size=registry.bot.attachments.chunk_size,
+    timeout=registry.bot.attachments.timeout,
+    encodings=registry.bot.attachments.encodings,
+)
+
+
+async def notify_admitted(session: UserSession):
+    """Пишет в ЛС пользователю, дождавшемуся своей очереди"""
+    try:
+        dm = await session.dm_channel.send(registry.messages.start.description.text)
+        session.dm_channel = dm.channel
+        session.save()
+        logger.info(f"Создана новая сессия из очереди для {session.user_id}")
+    except discord.HTTPException:
+        logger.warning(f"Не удалось написать пользователю {session.user_id}, слот освобожден")
+        session.close()
+
+
+session_manager.on_admit = notify_admitted
 
 client = AIClient(
     env_path=CONFIGS_BASE_DIR / ".env",
-    prompt_path=PROMPTS_BASE_DIR / "arrest_report.txt",
+    report_type=registry.bot.bot.report_type,
 )
 
-
-async def setup_start_message(bot: commands.Bot):
-    for guild in bot.guilds:
-        channel = discord.utils.get(guild.text_channels, name=bot_config.bot.start_channel)
-        if not channel:
+section_checker = None
+if registry.bot.sections.enabled:
+    section_checker = SectionChecker(
+        client,
+        min_chars=registry.bot.sections.min_chars,
+        target_chars=registry.bot.sections.target_chars,
+        max_sections=registry.bot.sections.max_sections,
+    )
+
+check_workers = None
+if registry.bot.workers.enabled:
+    check_workers = CheckWorkerPool(
+        processes=registry.bot.workers.processes,
+        env_path=CONFIGS_BASE_DIR / ".env",
+        report_type=registry.bot.bot.report_type,
+        max_concurrent=registry.bot.ai.max_concurrent,
+        job_timeout=registry.bot.ai.http.total_timeout + registry.bot.workers.job_grace,
+    )
+
+# Полная проверка (целиком или по частям) либо проверка только измененного участка,
+# с пулом процессов - то же самое, но вне event loop бота
+report_checker = check_workers or IncrementalChecker(client, section_checker,
+                                                     max_changed_ratio=registry.bot.incremental.max_changed_ratio)
+
+result_cache = None
+if registry.bot.cache.enabled:
+    result_cache = ResultCache(
+        db_path=SRC_BASE_DIR / registry.bot.cache.path,
+        memory_entries=registry.bot.cache.memory_entries,
+        max_disk_bytes=registry.bot.cache.max_disk_bytes,
+        ttl=registry.bot.cache.ttl,
+    )
+
+    def invalidate_stale_results(snapshot: ConfigSnapshot):
+        # Записи, сделанные со старой версией промптов, больше не валидны
+        result_cache.invalidate_prompt(ResultCache.prompt_hash(p) for p in snapshot.prompts.values())
+
+    invalidate_stale_results(registry.snapshot)
+    registry.on_reload.append(invalidate_stale_results)
+
+metrics.Gauge("report_sessions_active", "Активные сессии", lambda: session_manager.active_count)
+metrics.Gauge("report_admission_queue_depth", "Пользователи в очереди на сессию", lambda: len(session_manager.queued))
+if check_workers:
+    # Окно ограничителя у каждого процесса пула свое, клиент основного процесса запросов не делает
+    metrics.Gauge("report_check_workers_in_flight", "Проверки, переданные в пул процессов",
+                  lambda: check_workers.in_flight)
+else:
+    metrics.Gauge("report_ai_window", "Текущее окно параллельных запросов к модели", lambda: client.limiter.window)
+    metrics.Gauge("report_ai_queue_depth", "Запросы, ожидающие места в окне", lambda: client.limiter.queue_depth)
+
+
+async def restore_sessions(bot: commands.Bot):
+    """Восстанавливает сессии после перезапуска и заново подключает кнопки к сообщениям с результатами"""
+    def resolve_channel(channel_id: int):
+        return bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
+    for session in await session_manager.restore(resolve_channel):
+        if session.last_result is None or not session.view_message_id or not session.dm_channel:
             continue
+        view = ReportView(session.last_result, session)
+        view.message = session.dm_channel.get_partial_message(session.view_message_id)
+        bot.add_view(view, message_id=session.view_message_id)
+        session.view = view
+
 
-        # Удаляем старое сообщение с кнопками (если есть)
+# 📘 Обработчик нажатия на "Инструкцию"
+async def help_callback(interaction: discord.Interaction):
+    await interaction.response.send_message(registry.messages.help.description.text, ephemeral=True)
+
+
+# ⚙️ Обработчик нажатия "Начать проверку"
+async def start_callback(interaction: discord.Interaction):
+    user = interaction.user
+
+    # Проверяем, есть ли уже активная сессия
+    existing_session = session_manager.get(user.id)
+    if existing_session and existing_session.active:
+        await interaction.response.send_message(registry.messages.err_already_started.description.text,
+                                                ephemeral=True)
+        return
+
+    if session_manager.is_queued(user.id):
+        await interaction.response.send_message(registry.messages.err_already_queued.description.text,
+                                                ephemeral=True)
+        return
+
+    # Создаём новую сессию, а если свободных слотов нет - ставим в очередь
+    session = await session_manager.create_session(user.id, dm_channel=user)
+    if not session:
+        queued = session_manager.enqueue(user.id, interaction.guild_id, dm_channel=user)
+        if queued is None:
+            metrics.rejections_total.inc(reason="queue_full")
+            await interaction.response.send_message(
+                registry.messages.err_too_many_clients.description.text,
+                ephemeral=True
+            )
+            return
+
+        metrics.rejections_total.inc(reason="queued")
+        position, wait = queued
+        await interaction.response.send_message(
+            registry.messages.queued.description.text.format(
+                position=position, wait=max(1, round(wait / 60))
+            ),
+            ephemeral=True
+        )
+        return
+
+    # Пишем пользователю в ЛС
+    try:
+        dm = await user.send(registry.messages.start.description.text)
+        # Канал ЛС, в отличие от пользователя, можно восстановить по id после перезапуска
+        session.dm_channel = dm.channel
+        session.save()
+        await interaction.response.send_message(registry.messages.start_notify.description.text,
+                                                ephemeral=True)
+        logger.info(f"Создана новая сессия для {user.name}")
+    except discord.Forbidden:
+        await interaction.response.send_message(registry.messages.err_dm_closed.description.text,
+                                                ephemeral=True)
+        session_manager.remove(user.id)
+        return
+
+
+def build_start_view() -> discord.ui.View:
+    """
+    Постоянный View стартового сообщения: custom_id фиксированы, поэтому один зарегистрированный
+    экземпляр обслуживает кнопки во всех гильдиях, в том числе после перезапуска
+    """
+    view = discord.ui.View(timeout=None)
+
+    start_button = discord.ui.Button(
+        label=registry.messages.initial.button.start.label,
+        style=discord.ButtonStyle.green,
+        custom_id="initial:start",
+    )
+
+    help_button = discord.ui.Button(
+        label=registry.messages.initial.button.help.label,
+        style=discord.ButtonStyle.blurple,
+        custom_id="initial:help",
+    )
+
+    # Добавляем кнопки и колбэки
+    start_button.callback = start_callback
+    help_button.callback = help_callback
+    view.add_item(start_button)
+    view.add_item(help_button)
+    return view
+
+
+def build_start_embed() -> discord.Embed:
+    # Основное embed-сообщение
+    embed = discord.Embed(
+        title=registry.messages.initial.title.text,
+        description=registry.messages.initial.description.text,
+        color=registry.messages.initial.title.color
+    )
+    embed.set_image(url=registry.messages.initial.image.url)
+    return embed
+
+
+start_view: Optional[discord.ui.View] = None
+# Каналы, где стартовое сообщение уже проверено в этом процессе: переподключения их пропускают
+_started_channels = set()
+
+
+def register_start_view(bot: commands.Bot):
+    """Регистрирует постоянный View стартового сообщения один раз за время работы процесса"""
+    global start_view
+    start_view = build_start_view()
+    bot.add_view(start_view)
+
+
+async def _ensure_start_message(bot: commands.Bot, channel: discord.TextChannel, embed: discord.Embed,
+                                content_hash: str):
+    """Переиспользует стартовое сообщение канала и редактирует его, только если изменился текст"""
+    message = None
+    saved = await session_store.get_start_message(channel.id) if session_store else None
+    if saved:
+        try:
+            message = await channel.fetch_message(saved[0])
+        except discord.NotFound:
+            message = None
+    else:
+        # Сообщение от версии без хранилища: ищем его один раз, дальше используется сохраненный id
         async for msg in channel.history(limit=20):
             if msg.author == bot.user:
-                await msg.delete()
+                message = msg
                 break
 
-        # Создаем View с кнопками
-        view = discord.ui.View(timeout=None)
+    if message is None:
+        message = await channel.send(embed=embed, view=start_view)
+        logger.info(f"Стартовое сообщение отправлено в #{channel.name} ({channel.guild.name})")
+    elif not saved or saved[1] != content_hash:
+        await message.edit(embed=embed, view=start_view)
+        logger.info(f"Стартовое сообщение обновлено в #{channel.name} ({channel.guild.name})")
 
-        start_button = discord.ui.Button(
-            label=messages_config.message.initial.button.start.label,
-            style=discord.ButtonStyle.green,
-        )
+    if session_store and saved != (message.id, content_hash):
+        await session_store.set_start_message(channel.id, message.id, content_hash)
 
-        help_button = discord.ui.Button(
-            label=messages_config.message.initial.button.help.label,
-            style=discord.ButtonStyle.blurple,
-        )
 
-        # 📘 Обработчик нажатия на "Инструкцию"
-        async def help_callback(interaction: discord.Interaction):
-            await interaction.response.send_message(messages_config.message.help.description.text, ephemeral=True)
-
-        # ⚙️ Обработчик нажатия "Начать проверку"
-        async def start_callback(interaction: discord.Interaction):
-            user = interaction.user
-
-            # Проверяем, есть ли уже активная сессия
-            existing_session = session_manager.get(user.id)
-            if existing_session and existing_session.active:
-                await interaction.response.send_message(messages_config.message.err_already_started.description.text,
-                                                        ephemeral=True)
-                return
-
-            # Создаём новую сессию
-            session = await session_manager.create_session(user.id, dm_channel=user)
-            if not session:
-                await interaction.response.send_message(
-                    messages_config.message.err_too_many_clients.description.text,
-                    ephemeral=True
-                )
-                return
-
-            # Пишем пользователю в ЛС
+async def setup_start_message(bot: commands.Bot):
+    embed = build_start_embed()
+    content_hash = hashlib.sha256(json.dumps(embed.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+    semaphore = asyncio.Semaphore(registry.bot.bot.startup_concurrency)
+
+    async def setup_guild(guild: discord.Guild):
+        channel = discord.utils.get(guild.text_channels, name=registry.bot.bot.start_channel)
+        if not channel or channel.id in _started_channels:
+            return
+        async with semaphore:
             try:
-                await user.send(messages_config.message.start.description.text)
-                await interaction.response.send_message(messages_config.message.start_notify.description.text,
-                                                        ephemeral=True)
-                logger.info(f"Создана новая сессия для {user.name}")
-            except discord.Forbidden:
-                await interaction.response.send_message(messages_config.message.err_dm_closed.description.text,
-                                                        ephemeral=True)
-                session_manager.remove(user.id)
-                return
-
-        # Добавляем кнопки и колбэки
-        start_button.callback = start_callback
-        help_button.callback = help_callback
-        view.add_item(start_button)
-        view.add_item(help_button)
-
-        # Основное embed-сообщение
-        embed = discord.Embed(
-            title=messages_config.message.initial.title.text,
-            description=messages_config.message.initial.description.text,
-            color=messages_config.message.initial.title.color
-        )
-        embed.set_image(url=messages_config.message.initial.image.url)
+                await _ensure_start_message(bot, channel, embed, content_hash)
+                _started_channels.add(channel.id)
+            except discord.HTTPException:
+                logger.exception(f"Не удалось подготовить стартовое сообщение в гильдии {guild.name}")
 
-        await channel.send(embed=embed, view=view)
+    await asyncio.gather(*(setup_guild(guild) for guild in bot.guilds))
 
 
 async def handle_dm(message: discord.Message):
     if message.author.bot:
         return
 
+    # Один снимок на всю обработку: перезагрузка конфига не меняет тексты посреди проверки
+    messages = registry.messages
+
     session = session_manager.get(message.author.id)
     if not session or not session.active:
-        await message.channel.send(messages_config.message.err_inactive_session.description.text)
+        await message.channel.send(messages.err_inactive_session.description.text)
         return
 
     # Сбрасываем таймер, если пользователь активен
@@ -112,51 +305,109 @@ async def handle_dm(message: discord.Message):
         session.reset_timeout()
 
     if session.processing:
-        await message.channel.send(messages_config.message.err_pls_wait.description.text)
+        await message.channel.send(messages.err_pls_wait.description.text)
         return
 
     if message.attachments:
-        file = message.attachments[0]
-        if not file.filename.endswith(".txt"):
-            await message.channel.send(messages_config.message.err_wrong_format.description.text)
+        # Слишком большие, нечитаемые и не .txt файлы отклоняются до обращения к модели
+        try:
+            with metrics.span("attachment"):
+                content = await attachment_reader.read(message.attachments)
+        except AttachmentError as e:
+            metrics.checks_total.inc(status="rejected")
+            await message.channel.send(messages[e.message_key].description.text.format(**e.params))
             return
-        content = (await file.read()).decode("utf-8")
     else:
-        content = message.content.strip()
+        content = normalize_text(message.content)
 
     if not content:
-        await message.channel.send(messages_config.message.err_wrong_file_input.description.text)
+        await message.channel.send(messages.err_wrong_file_input.description.text)
         return
 
+    # Механические нарушения находим локально, явно непригодный текст не отправляем модели
+    lint = LintResult()
+    if report_linter:
+        with metrics.span("lint"):
+            lint = report_linter.check(content)
+        if lint.blocked:
+            metrics.checks_total.inc(status="blocked")
+            issues = [f"• {issue}" for rec in lint.recommendations for issue in rec.issues]
+            await message.channel.send("\n".join([messages.err_lint_blocked.description.text, *issues]))
+            return
+
     session.processing = True
-    processing_msg = await message.channel.send(messages_config.message.check_started.description.text)
+    request_id = new_request_id(str(message.author.id))
+    trace = metrics.start_trace("check", request_id) if registry.bot.metrics.trace else None
+    processing_msg = await message.channel.send(messages.check_started.description.text)
+    progress = StreamingProgress(processing_msg) if registry.bot.ai.stream else None
 
     try:
-        session.add_user_message(content)
-        result = await client.query(content, history=session.chat_history)
+        history = history_budget.compact(session.chat_history)
+
+        result = None
+        if result_cache:
+            prompt_hash = ResultCache.prompt_hash(client.role_prompt(session.report_type))
+            cache_key = ResultCache.make_key(content, prompt_hash, client.model_name, history)
+            result = await result_cache.get(cache_key)
+
+        if result is not None:
+            # Повторная отправка того же отчета не расходует попытку
+            logger.info(f"Результат проверки взят из кэша: {result_cache.stats()}")
+            metrics.checks_total.inc(status="cached")
+            blocks = build_blocks([CheckedSection(content, result)])
+        else:
+            started = time.monotonic()
+            if progress:
+                for rec in lint.recommendations:
+                    progress.add(rec)
+            result, blocks = await report_checker.check(
+                content,
+                previous_blocks=session.report_blocks if registry.bot.incremental.enabled else None,
+                previous_result=session.last_result,
+                history=history,
+                report_type=session.report_type,
+                findings=lint.recommendations,
+                on_recommendation=progress.add if progress else None,
+            )
+            if progress:
+                await progress.flush()
+            result = ReportCheckResult(merge_recommendations(lint.recommendations, result.recommendations),
+                                       result.corrected_report)
+            session_manager.record_check(time.monotonic() - started)
+            session.checks_remaining -= 1
+            metrics.checks_total.inc(status="ok")
+            if result_cache:
+                await result_cache.set(cache_key, prompt_hash, result)
+
+        session.report_blocks = blocks
         session.last_result = result
-        session.add_assistant_message(result.corrected_report)
-        session.checks_remaining -= 1
-
-        file_bytes = io.BytesIO(result.corrected_report.encode("utf-8"))
-        discord_file = discord.File(file_bytes, filename="report_example.txt")
+        session.add_user_message(content)
+        session.add_assistant_message(result.corrected_report, summary=summarize_result(result))
 
         view = ReportView(result, session)
-        embed = view.make_embed()
-        await message.channel.send(embed=embed, file=discord_file, view=view)
+        with metrics.span("discord_send"):
+            view.message = await message.channel.send(embed=view.pages[0], file=view.make_file(), view=view)
+        previous_view, session.view = session.view, view
+        session.view_message_id = getattr(view.message, "id", None)
+        if previous_view:
+            await previous_view.retire()
 
     except Exception as e:
         logger.exception("Ошибка при проверке отчета")
-        await processing_msg.edit(content=f"{messages_config.message.err_exception.description.text} {e}")
+        metrics.checks_total.inc(status="error")
+        if progress:
+            progress.cancel()
+        await processing_msg.edit(content=f"{messages.err_exception.description.text} {e}")
     finally:
         session.processing = False
+        session.save()
+        if trace:
+            metrics.finish_trace(trace)
         if session.active and session.checks_remaining > 0:
             session.reset_timeout()
 
     # Проверка лимита
     if session.checks_remaining <= 0:
-        session.active = False
-        if session.timeout_task and not session.timeout_task.done():
-            session.timeout_task.cancel()
+        session.close()
 
-        await message.channel.send(messages_config.message.err_limit_reached.description.text)
+        await message.channel.send(messages.err_limit_reached.description.text)
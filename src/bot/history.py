@@ -0,0 +1,56 @@
+from typing import List
+
+from src.bot.ai_client import ReportCheckResult
+from src.utils import utils
+
+
+def summarize_result(result: ReportCheckResult) -> str:
+    """Краткая сводка замечаний для замены полного исправленного отчета в старой истории"""
+    lines = [f"- {rec.criterion}: {'; '.join(rec.issues)}" for rec in result.recommendations if rec.issues]
+    return "\n".join(lines) or "- замечаний нет"
+
+
+class HistoryBudget:
+    """
+    Укладывает историю диалога в бюджет токенов: последняя пара "отчет - исправление" передается
+    целиком, более ранние заменяются сводкой выданных замечаний
+    """
+
+    SUMMARY_HEADER = "Сводка замечаний к предыдущим версиям отчета (полные тексты опущены):"
+    DROPPED_REPORT = "Предыдущая версия отчета опущена для экономии контекста."
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+
+    def compact(self, history: List[dict]) -> List[dict]:
+        """Возвращает историю в формате API (только role и content), уложенную в бюджет"""
+        messages = [{"role": m["role"], "content": m["content"]} for m in history]
+        if utils.estimate_messages_tokens(messages) <= self.max_tokens:
+            return messages
+
+        # Последний ответ ассистента и предшествующий ему отчет оставляем полностью
+        last_assistant = max((i for i, m in enumerate(history) if m["role"] == "assistant"), default=None)
+        if last_assistant is None:
+            return []
+        older = history[:last_assistant - 1] if last_assistant > 0 else []
+        latest = messages[max(0, last_assistant - 1):last_assistant + 1]
+
+        summaries = [m["summary"] for m in older if m["role"] == "assistant" and m.get("summary")]
+        compacted = []
+        if summaries:
+            compacted.append({
+                "role": "assistant",
+                "content": "\n".join([self.SUMMARY_HEADER, *summaries]),
+            })
+        compacted.extend(latest)
+        if utils.estimate_messages_tokens(compacted) <= self.max_tokens:
+            return compacted
+
+        # Все еще не влезает - убираем полный текст предыдущего отчета, оставляя исправление
+        compacted = [
+            {"role": m["role"], "content": self.DROPPED_REPORT} if m is latest[0] and m["role"] == "user" else m
+            for m in compacted
+        ]
+        if utils.estimate_messages_tokens(compacted) <= self.max_tokens:
+            return compacted
+        return []
@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional, Tuple
+
+from src.bot.ai_client import AIClient, Recommendation, ReportCheckResult
+from src.bot.sections import CheckedSection, SectionChecker, paragraphs
+from src.utils import logger
+
+logger = logger.get_logger("incremental")
+
+
+@dataclass
+class ReportBlock:
+    """Абзацы отправленного отчета и их исправленный вариант"""
+    paragraphs: List[str]
+    corrected: str
+
+
+@dataclass
+class _Change:
+    before: List[ReportBlock]
+    after: List[ReportBlock]
+    fragment: List[str]  # измененные абзацы новой версии отчета
+    context_before: Optional[str]
+    context_after: Optional[str]
+
+
+def build_blocks(sections: List[CheckedSection]) -> List[ReportBlock]:
+    """
+    Сопоставляет исправления с исходным текстом: если модель сохранила разбивку на абзацы,
+    каждый абзац становится отдельным блоком, иначе блоком остается весь фрагмент
+    """
+    blocks = []
+    for section in sections:
+        original = paragraphs(section.text)
+        corrected = paragraphs(section.result.corrected_report)
+        if len(original) == len(corrected):
+            blocks.extend(ReportBlock([o], c) for o, c in zip(original, corrected))
+        elif original:
+            blocks.append(ReportBlock(original, section.result.corrected_report.strip()))
+    return blocks
+
+
+def _find_change(blocks: List[ReportBlock], report: str) -> Optional[_Change]:
+    """Находит измененный участок новой версии, расширенный до границ блоков"""
+    owner = [i for i, block in enumerate(blocks) for _ in block.paragraphs]
+    old = [p for block in blocks for p in block.paragraphs]
+    new = paragraphs(report)
+    changes = [op for op in SequenceMatcher(None, old, new, autojunk=False).get_opcodes() if op[0] != "equal"]
+    if not changes:
+        return None
+    i1, i2 = changes[0][1], changes[-1][2]
+    j1, j2 = changes[0][3], changes[-1][4]
+
+    # Изменение внутри блока затрагивает весь блок: его исправление нельзя разрезать
+    first = owner[i1] if i1 < len(old) else len(blocks)
+    last = owner[i2 - 1] + 1 if i2 > i1 else first
+    if i1 < len(old) and last == first and owner.index(first) < i1:
+        last = first + 1
+    start = owner.index(first) if first < len(blocks) else len(old)
+    end = start + sum(len(b.paragraphs) for b in blocks[first:last])
+    j1, j2 = j1 - (i1 - start), j2 + (end - i2)
+
+    return _Change(
+        before=blocks[:first],
+        after=blocks[last:],
+        fragment=new[j1:j2],
+        context_before=new[j1 - 1] if j1 > 0 else None,
+        context_after=new[j2] if j2 < len(new) else None,
+    )
+
+
+class IncrementalChecker:
+    """
+    Повторная проверка исправленного отчета: в модель уходит только измененный участок
+    с соседними абзацами и замечания к прошлой версии, остальные исправления берутся из прошлой проверки
+    """
+
+    NOTE = ("Пользователь исправил ранее проверенный отчет. Ниже только измененный фрагмент, соседние абзацы "
+            "для контекста и замечания к предыдущей версии. В recommendations верни актуальный полный список "
+            "замечаний ко всему отчету: убери исправленные, сохрани остальные, добавь новые для измененного "
+            "фрагмента. В corrected_report верни исправленный вариант только измененного фрагмента, без контекста.")
+
+    def __init__(self, client: AIClient, section_checker: Optional[SectionChecker], max_changed_ratio: float):
+        self.client = client
+        self.section_checker = section_checker
+        self.max_changed_ratio = max_changed_ratio
+
+    def _message(self, change: _Change, previous: List[Recommendation]) -> str:
+        parts = [self.NOTE, "", "Замечания к предыдущей версии:"]
+        parts.extend(f"- {rec.criterion}: {'; '.join(rec.issues)}" for rec in previous if rec.issues)
+        if change.context_before:
+            parts.extend(["", "Контекст до фрагмента:", change.context_before])
+        parts.extend(["", "Измененный фрагмент:", "\n\n".join(change.fragment)])
+        if change.context_after:
+            parts.extend(["", "Контекст после фрагмента:", change.context_after])
+        return "\n".join(parts)
+
+    async def _full_check(self, report: str, history: Optional[List[dict]], report_type: Optional[str],
+                          findings: Optional[List[Recommendation]],
+                          on_recommendation: Optional[Callable[[Recommendation], None]]
+                          ) -> Tuple[ReportCheckResult, List[ReportBlock]]:
+        if self.section_checker:
+            result, sections = await self.section_checker.check(report, history=history, report_type=report_type,
+                                                                findings=findings, on_recommendation=on_recommendation)
+        else:
+            result = await self.client.check(report, history, report_type, findings, on_recommendation)
+            sections = [CheckedSection(report, result)]
+        return result, build_blocks(sections)
+
+    async def check(
+            self,
+            report: str,
+            previous_blocks: Optional[List[ReportBlock]] = None,
+            previous_result: Optional[ReportCheckResult] = None,
+            history: Optional[List[dict]] = None,
+            report_type: Optional[str] = None,
+            findings: Optional[List[Recommendation]] = None,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None,
+    ) -> Tuple[ReportCheckResult, List[ReportBlock]]:
+        """
+        Проверяет только изменения относительно прошлой версии, а если их слишком много
+        или прошлой версии нет - весь отчет. Возвращает результат и блоки для следующей проверки
+        """
+        change = _find_change(previous_blocks, report) if previous_blocks and previous_result else None
+        changed_chars = sum(len(p) for p in change.fragment) if change else 0
+        if not change or not change.fragment or changed_chars > self.max_changed_ratio * len(report):
+            return await self._full_check(report, history, report_type, findings, on_recommendation)
+
+        logger.info(f"Повторная проверка только измененного участка: {changed_chars} из {len(report)} символов")
+        # Прошлая версия и замечания к ней уже есть в сообщении, историю не передаем
+        result = await self.client.check(self._message(change, previous_result.recommendations), None,
+                                         report_type, findings, on_recommendation)
+
+        corrected = CheckedSection("\n\n".join(change.fragment), result)
+        blocks = [*change.before, *build_blocks([corrected]), *change.after]
+        corrected_report = "\n\n".join(block.corrected for block in blocks if block.corrected)
+        return ReportCheckResult(result.recommendations, corrected_report), blocks
@@ -0,0 +1,97 @@
+import asyncio
+from collections import deque
+from typing import Deque
+
+from src.utils import logger
+
+logger = logger.get_logger("limiter")
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель параллельных запросов с адаптивным окном (AIMD):
+    окно растет на 1 за каждый "круг" быстрых ответов и уменьшается в decrease_factor раз
+    при ответах 429 или превышении порога задержки
+    """
+
+    def __init__(
+            self,
+            initial: int,
+            min_limit: int,
+            max_limit: int,
+            latency_threshold: float,
+            decrease_factor: float = 0.5,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+
+        self.window = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self.window))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict:
+        return {
+            "window": round(self.window, 2),
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    async def acquire(self) -> float:
+        """Ждет свободного места в окне и возвращает время начала запроса"""
+        loop = asyncio.get_running_loop()
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return loop.time()
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Место уже было выделено - возвращаем его следующему
+                self.in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        return loop.time()
+
+    def release(self, started_at: float, latency: float | None = None, rate_limited: bool = False):
+        """
+        Освобождает место и подстраивает окно.
+        latency=None означает ошибку, по которой нельзя судить о загрузке API
+        """
+        if rate_limited or (latency is not None and latency > self.latency_threshold):
+            # Уменьшаем окно не чаще одного раза на поколение запросов,
+            # чтобы пачка одновременных 429 не схлопнула его до минимума
+            if started_at >= self._last_decrease:
+                self.window = max(float(self.min_limit), self.window * self.decrease_factor)
+                self._last_decrease = asyncio.get_running_loop().time()
+                logger.info(f"Окно запросов уменьшено до {self.window:.2f} "
+                            f"({'429' if rate_limited else f'задержка {latency:.1f} с'})")
+        elif latency is not None:
+            self.window = min(float(self.max_limit), self.window + 1 / self.window)
+
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
@@ -0,0 +1,171 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from src.bot.ai_client import Recommendation
+
+STYLE = "Стиль изложения"
+WORDING = "Ограничения и замены слов"
+DATE_AND_PLACE = "Дата и место происшествия"
+SEARCH_RESULTS = "Результаты обыска и ареста"
+NOT_A_REPORT = "Отчет не может быть проверен"
+
+_WORD_RE = re.compile(r"\w+")
+_CYRILLIC_RE = re.compile(r"[а-яё]", re.IGNORECASE)
+_FORMATTING_RE = re.compile(r"\*\*|__|~~|`|^\s*#{1,6}\s|^\s*[-*•]\s", re.MULTILINE)
+_FIRST_PERSON_RE = re.compile(r"\b(я|мы|меня|мне|мной|нас|нам|нами|мой|моя|мое|моё|мои|наш|наша|наше|наши)\b",
+                              re.IGNORECASE)
+# Словоформы перечислены явно: основа с \w* задевает обычные слова ("наглядно", "ул. Пушкина")
+_NOUN = r"(?:а|у|ом|е|ы|ов|ам|ами|ах)?"
+_ADJECTIVE = r"(?:о|ый|ая|ое|ые|ого|ому|ой|ую|ым|ых|ыми)"
+_COLLOQUIAL_RE = re.compile(rf"\b(ствол{_NOUN}|доки|коп{_NOUN}|мент{_NOUN}|тачк(?:а|и|у|ой|е)|тачек|"
+                            rf"бабки|бабок|бабками|пушк(?:а|и|у|ой|е)|жесть|капец|офигел(?:а|и)?|"
+                            rf"придур(?:ок|ка|ку|ком|ке|ки|ков|кам|ками)|урод{_NOUN}|ужасн{_ADJECTIVE}|"
+                            rf"отвратительн{_ADJECTIVE}|нагл{_ADJECTIVE}|наглость|к сожалению|к счастью)\b",
+                            re.IGNORECASE)
+# Прямая речь и команды в кавычках: первое лицо и восклицательный знак в них допустимы
+_QUOTED_RE = re.compile(r"«[^»]*»|„[^“”]*[“”]|“[^”]*”|\"[^\"\n]*\"")
+_FORBIDDEN_RE = re.compile(r"\b(наряд\w*|милици\w*|милиционер\w*)\b", re.IGNORECASE)
+_REPLACEMENTS = [
+    (re.compile(r"\bтабельн\w* оружи\w*", re.IGNORECASE), "служебное оружие"),
+    (re.compile(r"\bпрохлоп\w*", re.IGNORECASE), "поверхностный обыск"),
+    (re.compile(r"\bафриканск\w* внешност\w*", re.IGNORECASE), "афроамериканец"),
+]
+_ROLE = r"(?:офицер\w*|подозреваем\w*|свидетел\w*|потерпевш\w*|задержанн\w*|сержант\w*|детектив\w*|гражданин\w*)"
+_CYRILLIC_NAME_RE = re.compile(rf"\b{_ROLE}\s+([А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+)")
+_RANKS_RU_RE = re.compile(r"\b(офицер|сержант|лейтенант|капитан|детектив|помощник шерифа|шериф)\w*", re.IGNORECASE)
+_RANKS_EN_RE = re.compile(r"\b(officer|sergeant|lieutenant|captain|detective|deputy|sheriff)\b", re.IGNORECASE)
+_DATE_RE = re.compile(r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b|\b\d{1,2}\s+(январ|феврал|март|апрел|ма[яй]|июн|июл|"
+                      r"август|сентябр|октябр|ноябр|декабр)\w*", re.IGNORECASE)
+_TIME_RE = re.compile(r"\b([01]?\d|2[0-3])[:.][0-5]\d\b")
+_PLACEHOLDER_RE = re.compile(r"\b[А-ЯЁA-Z0-9]+(?:_[А-ЯЁA-Z0-9]+)+\b")
+_WEAPON_FOUND_RE = re.compile(r"\b(обнаруж|найд|нашл|изъя)\w*.{0,80}?\b(пистолет|револьвер|дробовик|обрез|автомат|"
+                              r"винтовк|оружи)\w*", re.IGNORECASE | re.DOTALL)
+_SERIAL_RE = re.compile(r"\bсерийн\w*", re.IGNORECASE)
+
+
+@dataclass
+class LintResult:
+    recommendations: List[Recommendation] = field(default_factory=list)
+    blocked: bool = False  # Проверку моделью выполнять нет смысла
+
+
+def _quote(matches: List[str], limit: int = 3) -> str:
+    unique = list(dict.fromkeys(m.strip() for m in matches))
+    quoted = ", ".join(f"\"{m}\"" for m in unique[:limit])
+    return quoted + (" и др." if len(unique) > limit else "")
+
+
+class ReportLinter:
+    """
+    Локальная проверка механических правил из промптов: оформление, запрещенные и разговорные слова,
+    единообразие званий, обязательные данные. Работает за миллисекунды и без обращения к модели
+    """
+
+    def __init__(self, min_words: int):
+        self.min_words = min_words
+        self.rules: List[Callable[[str], Optional[tuple]]] = [
+            self._formatting,
+            self._first_person,
+            self._colloquial,
+            self._cyrillic_names,
+            self._ranks,
+            self._placeholders,
+            self._forbidden,
+            *(self._replacement(pattern, replacement) for pattern, replacement in _REPLACEMENTS),
+            self._date_and_time,
+            self._weapon_serial,
+        ]
+
+    def check(self, text: str) -> LintResult:
+        words = len(_WORD_RE.findall(text))
+        if not _CYRILLIC_RE.search(text):
+            return LintResult([Recommendation(NOT_A_REPORT, ["Отчет должен быть написан на русском языке"])],
+                              blocked=True)
+        if words < self.min_words:
+            return LintResult([Recommendation(NOT_A_REPORT, [
+                f"Текст слишком короткий для отчета: {words} сл. при минимуме {self.min_words}"
+            ])], blocked=True)
+
+        grouped: Dict[str, List[str]] = {}
+        for rule in self.rules:
+            finding = rule(text)
+            if finding:
+                criterion, issue = finding
+                grouped.setdefault(criterion, []).append(issue)
+        return LintResult([Recommendation(criterion, issues) for criterion, issues in grouped.items()])
+
+    # ---------------- ПРАВИЛА ----------------
+    @staticmethod
+    def _formatting(text: str):
+        if _FORMATTING_RE.search(text):
+            return STYLE, ("Текст содержит оформление (жирный шрифт, списки, заголовки или код) - "
+                           "отчет пишется без оформления")
+
+    @staticmethod
+    def _first_person(text: str):
+        # Прямая речь в кавычках передается дословно, в том числе от первого лица
+        matches = [m.group(0) for m in _FIRST_PERSON_RE.finditer(_QUOTED_RE.sub("", text))]
+        if matches:
+            return STYLE, f"События нужно излагать от третьего лица, найдено: {_quote(matches)}"
+
+    @staticmethod
+    def _colloquial(text: str):
+        matches = [m.group(0) for m in _COLLOQUIAL_RE.finditer(text)]
+        if "!" in _QUOTED_RE.sub("", text):
+            matches.append("!")
+        if matches:
+            return STYLE, f"Разговорные или эмоциональные выражения недопустимы: {_quote(matches)}"
+
+    @staticmethod
+    def _cyrillic_names(text: str):
+        matches = [m.group(1) for m in _CYRILLIC_NAME_RE.finditer(text)]
+        if matches:
+            return STYLE, f"Имена указаны кириллицей, требуется латиница: {_quote(matches)}"
+
+    @staticmethod
+    def _ranks(text: str):
+        if _RANKS_RU_RE.search(text) and _RANKS_EN_RE.search(text):
+            return STYLE, "Звания указаны и на русском, и на английском - нужно единообразие во всем отчете"
+
+    @staticmethod
+    def _placeholders(text: str):
+        matches = _PLACEHOLDER_RE.findall(text)
+        if matches:
+            return STYLE, f"Остались незаполненные поля из примера исправленного отчета: {_quote(matches)}"
+
+    @staticmethod
+    def _forbidden(text: str):
+        matches = [m.group(0) for m in _FORBIDDEN_RE.finditer(text)]
+        if matches:
+            return WORDING, f"Термины, не свойственные американской полиции: {_quote(matches)}"
+
+    @staticmethod
+    def _replacement(pattern: re.Pattern, replacement: str):
+        def rule(text: str):
+            matches = [m.group(0) for m in pattern.finditer(text)]
+            if matches:
+                return WORDING, f"{_quote(matches)} следует заменить на \"{replacement}\""
+
+        return rule
+
+    @staticmethod
+    def _date_and_time(text: str):
+        if not _DATE_RE.search(text) and not _TIME_RE.search(text):
+            return DATE_AND_PLACE, "Не указаны дата и время происшествия"
+
+    @staticmethod
+    def _weapon_serial(text: str):
+        if _WEAPON_FOUND_RE.search(text) and not _SERIAL_RE.search(text):
+            return SEARCH_RESULTS, ("Для найденного оружия не указан серийный номер "
+                                    "(или явно \"серийный номер отсутствует\")")
+
+
+def merge_recommendations(local: List[Recommendation], remote: List[Recommendation]) -> List[Recommendation]:
+    """Объединяет локальные замечания с замечаниями модели по критериям, без повторов"""
+    merged: Dict[str, List[str]] = {}
+    for rec in [*local, *remote]:
+        issues = merged.setdefault(rec.criterion, [])
+        seen = {i.casefold() for i in issues}
+        issues.extend(i for i in rec.issues if i.casefold() not in seen)
+    return [Recommendation(criterion, issues) for criterion, issues in merged.items()]
@@ -1,15 +1,72 @@
+import asyncio
+import signal
+
 import discord
 from discord.ext import commands
 
-from src.bot.handlers import setup_start_message, handle_dm
+from src.bot.handlers import (setup_start_message, handle_dm, register_start_view, restore_sessions, client,
+                              result_cache, session_store, check_workers, attachment_reader)
 from src.utils import logger
+from src.utils import metrics
+from src.utils.config_registry import registry
 
 logger = logger.get_logger("bot")
 
+
+# Все шарды обслуживаются одним процессом: ЛС Discord доставляет только в нулевой шард, поэтому
+# сессии и лимиты остаются в одном месте, а нагрузку от проверок снимает пул процессов (workers)
+BotBase = commands.AutoShardedBot if registry.bot.sharding.enabled else commands.Bot
+
+
+class ReportBot(BotBase):
+    metrics_runner = None
+    config_watcher = None
+    shutting_down = False
+
+    async def setup_hook(self):
+        if registry.bot.metrics.enabled:
+            self.metrics_runner = await metrics.start_server(registry.bot.metrics.host, registry.bot.metrics.port)
+        # Изменения конфигов и промптов применяются без перезапуска бота
+        self.config_watcher = asyncio.create_task(registry.watch(registry.bot.bot.config_reload_interval))
+        register_start_view(self)
+        if check_workers:
+            check_workers.start()
+        if session_store:
+            session_store.start()
+            await restore_sessions(self)
+        # deploy.sh останавливает бота через pkill (SIGTERM): закрываемся штатно, сохраняя сессии
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass  # Windows
+
+    async def close(self):
+        if self.shutting_down or self.is_closed():
+            return
+        self.shutting_down = True
+        # Ресурсы освобождаются до super().close(): при SIGTERM после него runner() возвращается,
+        # asyncio.run отменяет оставшиеся задачи, и код после await уже не выполнится
+        if self.config_watcher:
+            self.config_watcher.cancel()
+        if check_workers:
+            await check_workers.close()
+        await client.close()
+        await attachment_reader.close()
+        if result_cache:
+            result_cache.close()
+        if session_store:
+            await session_store.close()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        await super().close()
+
 intents = discord.Intents.default()
 intents.messages = True
 intents.dm_messages = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+shard_options = {}
+if registry.bot.sharding.enabled and registry.bot.sharding.shard_count:
+    shard_options["shard_count"] = registry.bot.sharding.shard_count
+bot = ReportBot(command_prefix="!", intents=intents, **shard_options)
 
 
 @bot.event
@@ -0,0 +1,143 @@
+import json
+from typing import Optional
+
+from pydantic_core import SchemaValidator, ValidationError, core_schema
+
+from src.utils import metrics
+from src.utils import utils
+
+DEFAULT_CRITERION = "Общие замечания"
+
+
+def _as_list(value):
+    # Одно замечание модель иногда отдает строкой вместо списка
+    return [value] if isinstance(value, str) else value
+
+
+def _as_items(value):
+    # {"критерий": ["замечание"]} вместо списка объектов
+    if isinstance(value, dict):
+        return [{"criterion": criterion, "issues": issues} for criterion, issues in value.items()]
+    return value
+
+
+def _require_content(value: dict) -> dict:
+    if not value["recommendations"] and not value["corrected_report"]:
+        raise ValueError("нет ни recommendations, ни corrected_report")
+    return value
+
+
+_RECOMMENDATION_SCHEMA = core_schema.typed_dict_schema(
+    {
+        "criterion": core_schema.typed_dict_field(
+            core_schema.with_default_schema(core_schema.str_schema(strip_whitespace=True),
+                                            default=DEFAULT_CRITERION),
+            required=False,
+        ),
+        "issues": core_schema.typed_dict_field(
+            core_schema.with_default_schema(
+                core_schema.no_info_before_validator_function(
+                    _as_list, core_schema.list_schema(core_schema.str_schema(strip_whitespace=True))
+                ),
+                default_factory=list,
+            ),
+            required=False,
+        ),
+    },
+    extra_behavior="ignore",
+)
+
+_RESULT_SCHEMA = core_schema.no_info_after_validator_function(_require_content, core_schema.typed_dict_schema(
+    {
+        "recommendations": core_schema.typed_dict_field(
+            core_schema.with_default_schema(
+                core_schema.no_info_before_validator_function(
+                    _as_items, core_schema.list_schema(_RECOMMENDATION_SCHEMA)
+                ),
+                default_factory=list,
+            ),
+            required=False,
+        ),
+        "corrected_report": core_schema.typed_dict_field(
+            core_schema.with_default_schema(core_schema.str_schema(), default=""),
+            required=False,
+        ),
+    },
+    extra_behavior="ignore",
+))
+
+# Схемы компилируются один раз при импорте
+_RECOMMENDATION = SchemaValidator(_RECOMMENDATION_SCHEMA)
+_RESULT = SchemaValidator(_RESULT_SCHEMA)
+
+# JSON Schema ответа для моделей, поддерживающих response_format=json_schema
+RESULT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "criterion": {"type": "string"},
+                    "issues": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["criterion", "issues"],
+                "additionalProperties": False,
+            },
+        },
+        "corrected_report": {"type": "string"},
+    },
+    "required": ["recommendations", "corrected_report"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMATS = {
+    "json_object": {"type": "json_object"},
+    "json_schema": {"type": "json_schema",
+                    "json_schema": {"name": "report_check", "strict": True, "schema": RESULT_JSON_SCHEMA}},
+}
+
+
+def parse_result(text: str) -> dict:
+    """
+    Разбирает ответ модели в проверенный по схеме словарь с recommendations и corrected_report.
+    Быстрый путь - разбор и валидация найденного объекта за один вызов pydantic-core, при ошибке -
+    исправление типичных ошибок модели (висячие запятые, переносы строк внутри строк)
+    """
+    stripped = text.strip()
+    validated = None
+    if stripped.startswith("{") and stripped.endswith("}"):
+        # Обычный случай при response_format: ответ - это сам объект, искать его не нужно
+        validated = stripped
+        try:
+            return _RESULT.validate_json(stripped)
+        except ValidationError:
+            pass
+
+    json_str = utils.find_json_object(text)
+    if json_str is None:
+        raise ValueError(f"Не удалось найти завершенный JSON-объект в ответе модели: {text[:200]}")
+    if json_str != validated:
+        try:
+            return _RESULT.validate_json(json_str)
+        except ValidationError:
+            pass
+
+    metrics.parse_repairs_total.inc()
+    try:
+        data = json.loads(utils.repair_json(json_str), strict=False)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Ошибка парсинга JSON: {e}\nСырой текст:\n{text[:500]}")
+    try:
+        return _RESULT.validate_python(data)
+    except ValidationError as e:
+        raise ValueError(f"Ответ модели не соответствует схеме: {e.errors()[0]['msg']}")
+
+
+def parse_recommendation(item: dict) -> Optional[dict]:
+    """Проверенная по схеме рекомендация из потока или None, если элемент некорректен"""
+    try:
+        return _RECOMMENDATION.validate_python(item)
+    except ValidationError:
+        return None
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from src.bot.ai_client import ReportCheckResult
+from src.utils import logger
+
+logger = logger.get_logger("result_cache")
+
+
+def normalize_report(text: str) -> str:
+    """Нормализует текст отчета, чтобы отличия только в пробелах и переносах давали один ключ"""
+    return " ".join(text.split())
+
+
+class ResultCache:
+    """
+    Кэш результатов проверки: LRU в памяти поверх SQLite на диске.
+    Ключ - хэш нормализованного отчета, промпта, модели и истории диалога
+    """
+
+    def __init__(self, db_path: Path, memory_entries: int, max_disk_bytes: int, ttl: float):
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict[str, Tuple[float, ReportCheckResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._prompt_hashes: Optional[frozenset] = None  # промпты, с которыми был последний сброс
+        self._invalidation: Optional[asyncio.Task] = None
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, prompt_hash TEXT NOT NULL, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        logger.info(f"ResultCache инициализирован: {db_path}, memory_entries={memory_entries}, ttl={ttl}")
+
+    @staticmethod
+    def prompt_hash(role_prompt: str) -> str:
+        return hashlib.sha256(role_prompt.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(report: str, prompt_hash: str, model_name: str, history: Optional[List[dict]]) -> str:
+        payload = json.dumps(
+            [normalize_report(report), prompt_hash, model_name, history or []],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def invalidate_prompt(self, prompt_hashes: Iterable[str]):
+        """
+        Удаляет все записи, созданные с промптами, которых больше нет. Если промпты не изменились
+        (перезагрузка только других конфигов), ничего не делает
+        """
+        prompt_hashes = frozenset(prompt_hashes)
+        if prompt_hashes == self._prompt_hashes:
+            return
+        self._prompt_hashes = prompt_hashes
+        self._memory.clear()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # При запуске event loop еще нет
+            self._disk_invalidate(prompt_hashes)
+            return
+        self._invalidation = loop.create_task(asyncio.to_thread(self._disk_invalidate, prompt_hashes))
+
+    async def get(self, key: str) -> Optional[ReportCheckResult]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result
+            del self._memory[key]
+
+        result = await asyncio.to_thread(self._disk_get, key, now)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self._remember(key, result, now)
+        self.hits += 1
+        return result
+
+    async def set(self, key: str, prompt_hash: str, result: ReportCheckResult):
+        now = time.time()
+        self._remember(key, result, now)
+        await asyncio.to_thread(self._disk_set, key, prompt_hash, result, now)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _remember(self, key: str, result: ReportCheckResult, now: float):
+        self._memory[key] = (now + self.ttl, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[ReportCheckResult]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if created_at + self.ttl <= now:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return ReportCheckResult.from_dict(json.loads(value))
+
+    def _disk_invalidate(self, prompt_hashes: frozenset):
+        placeholders = ",".join("?" * len(prompt_hashes))
+        with self._lock:
+            deleted = self._db.execute(f"DELETE FROM results WHERE prompt_hash NOT IN ({placeholders})",
+                                       tuple(prompt_hashes)).rowcount
+            self._db.commit()
+        if deleted:
+            logger.info(f"Промпт изменился, удалено записей кэша: {deleted}")
+
+    def _disk_set(self, key: str, prompt_hash: str, result: ReportCheckResult, now: float):
+        value = json.dumps(asdict(result), ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, prompt_hash, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float):
+        # Сначала устаревшие записи, затем самые давно запрошенные до укладывания в лимит
+        self._db.execute("DELETE FROM results WHERE created_at <= ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
@@ -0,0 +1,39 @@
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    """Скользящее окно задержек модели для расчета перцентилей"""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def observe(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p * len(ordered)) - 1))
+        return ordered[index]
+
+
+@dataclass
+class ModelRoute:
+    name: str
+    timeout: float
+    response_format: Optional[str] = None  # json_object или json_schema, если провайдер их поддерживает
+    latency: LatencyTracker = field(default_factory=LatencyTracker)
+    failures: int = 0
+
+    def hedge_delay(self, percentile: float, min_samples: int, default: float, minimum: float) -> float:
+        """Через сколько секунд без ответа стоит отправить дублирующий запрос в следующую модель"""
+        if len(self.latency) < min_samples:
+            return default
+        return max(minimum, self.latency.percentile(percentile))
@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+from typing import Callable, List, Optional, Set, Tuple
+
+from src.utils import logger
+
+logger = logger.get_logger("scheduler")
+
+
+class TimerHandle:
+    __slots__ = ("when", "callback", "cancelled", "_scheduler")
+
+    def __init__(self, when: float, callback: Callable, scheduler: "TimerScheduler"):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+        self._scheduler = scheduler
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self._scheduler._cancelled += 1
+
+
+class TimerScheduler:
+    """
+    Общий планировщик таймеров на куче: одна фоновая задача обслуживает таймауты
+    всех сессий вместо отдельной задачи на каждого пользователя
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._cancelled
+
+    def schedule(self, delay: float, callback: Callable) -> TimerHandle:
+        """Вызывает callback через delay секунд. Корутины запускаются отдельной задачей"""
+        loop = asyncio.get_running_loop()
+        handle = TimerHandle(loop.time() + delay, callback, self)
+        heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+        self._compact()
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        elif self._heap[0][2] is handle:
+            # Новый таймер раньше текущего ближайшего - будим цикл
+            self._wakeup.set()
+        return handle
+
+    def _compact(self):
+        # Отмененные таймеры удаляются лениво, но не даем им занять больше половины кучи
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            when, _, handle = self._heap[0]
+            if handle.cancelled:
+                heapq.heappop(self._heap)
+                self._cancelled -= 1
+                continue
+
+            if when > loop.time():
+                self._wakeup.clear()
+                timer = loop.call_at(when, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    timer.cancel()
+                continue
+
+            heapq.heappop(self._heap)
+            handle.cancelled = True
+            self._fire(handle)
+
+    def _fire(self, handle: TimerHandle):
+        try:
+            result = handle.callback()
+        except Exception:
+            logger.exception("Ошибка в обработчике таймера")
+            return
+
+        if asyncio.iscoroutine(result):
+            task = asyncio.get_running_loop().create_task(result)
+            self._running.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Ошибка в обработчике таймера", exc_info=task.exception())
+
+
+scheduler = TimerScheduler()
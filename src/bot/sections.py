@@ -0,0 +1,133 @@
+import asyncio
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from src.bot.ai_client import AIClient, Recommendation, ReportCheckResult
+from src.bot.linter import merge_recommendations
+from src.utils import logger
+
+logger = logger.get_logger("sections")
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+@dataclass
+class CheckedSection:
+    text: str
+    result: ReportCheckResult
+
+
+def paragraphs(text: str) -> List[str]:
+    """Непустые абзацы текста"""
+    return [p.strip() for p in _PARAGRAPH_RE.split(text.strip()) if p.strip()]
+
+
+def _pieces(text: str, limit: int) -> List[str]:
+    """Абзацы отчета; слишком длинные абзацы делятся по строкам, затем по предложениям"""
+    pieces = []
+    for paragraph in paragraphs(text):
+        if len(paragraph) <= limit:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.splitlines():
+            pieces.extend([line] if len(line) <= limit else _SENTENCE_RE.split(line))
+    return [p.strip() for p in pieces if p.strip()]
+
+
+def split_sections(text: str, target_chars: int, max_sections: int) -> List[str]:
+    """
+    Делит отчет на последовательные фрагменты примерно по target_chars символов по границам абзацев,
+    не больше max_sections штук
+    """
+    target = max(target_chars, math.ceil(len(text) / max_sections))
+    sections, current = [], []
+    size = 0
+    for piece in _pieces(text, target):
+        if current and size + len(piece) > target:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    # Жадная упаковка дает лишние фрагменты, когда абзацы чуть больше половины target:
+    # соседние фрагменты объединяются, начиная с самой короткой пары, пока их не станет max_sections
+    while len(sections) > max(1, max_sections):
+        i = min(range(len(sections) - 1), key=lambda k: len(sections[k]) + len(sections[k + 1]))
+        sections[i:i + 2] = [f"{sections[i]}\n\n{sections[i + 1]}"]
+    return sections
+
+
+class SectionChecker:
+    """
+    Проверка длинного отчета по частям: фрагменты отправляются в модель одновременно,
+    поэтому время ответа определяется самым медленным фрагментом, а не размером всего отчета
+    """
+
+    SECTION_NOTE = ("Это фрагмент {index} из {total} длинного отчета, остальные фрагменты проверяются отдельно. "
+                    "Проверяй только этот фрагмент и не отмечай отсутствие данных (дата, участники, "
+                    "результаты ареста), которые могут быть в других фрагментах. "
+                    "В corrected_report верни исправленный вариант только этого фрагмента.")
+
+    def __init__(self, client: AIClient, min_chars: int, target_chars: int, max_sections: int):
+        self.client = client
+        self.min_chars = min_chars
+        self.target_chars = target_chars
+        self.max_sections = max_sections
+
+    def split(self, report: str) -> List[str]:
+        if len(report) < self.min_chars:
+            return [report]
+        return split_sections(report, self.target_chars, self.max_sections)
+
+    async def check(
+            self,
+            report: str,
+            history: Optional[List[dict]] = None,
+            report_type: Optional[str] = None,
+            findings: Optional[List[Recommendation]] = None,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None,
+    ) -> Tuple[ReportCheckResult, List[CheckedSection]]:
+        """
+        Проверяет отчет целиком или по фрагментам и возвращает объединенный результат
+        вместе с результатами отдельных фрагментов
+        """
+        sections = self.split(report)
+        if len(sections) == 1:
+            result = await self.client.check(report, history, report_type, findings, on_recommendation)
+            return result, [CheckedSection(report, result)]
+
+        logger.info(f"Отчет ({len(report)} символов) проверяется по частям, фрагментов: {len(sections)}")
+        total = len(sections)
+        # История диалога относится ко всему отчету, во фрагменты ее не передаем
+        tasks = [
+            asyncio.create_task(self.client.check(f"{self.SECTION_NOTE.format(index=i, total=total)}\n\n{text}",
+                                                  None, report_type, findings, on_recommendation))
+            for i, text in enumerate(sections, 1)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Без одного фрагмента результат не собрать: остальные запросы отменяем, не расходуя квоту
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        checked = [CheckedSection(text, result) for text, result in zip(sections, results)]
+        return self.merge(checked), checked
+
+    @staticmethod
+    def merge(sections: List[CheckedSection]) -> ReportCheckResult:
+        """
+        Согласует результаты фрагментов: замечания группируются по критериям без повторов,
+        исправленные фрагменты собираются в исходном порядке
+        """
+        recommendations: List[Recommendation] = []
+        for section in sections:
+            recommendations = merge_recommendations(recommendations, section.result.recommendations)
+        recommendations = [r for r in recommendations if r.issues]
+        corrected = "\n\n".join(s.result.corrected_report.strip() for s in sections if s.result.corrected_report)
+        return ReportCheckResult(recommendations, corrected)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.bot.sessions import UserSession
+from src.utils import logger
+
+logger = logger.get_logger("session_store")
+
+
+class SessionStore:
+    """
+    Хранилище активных сессий в SQLite (WAL), чтобы перезапуск бота не сбрасывал проверки и историю.
+    Изменения копятся в памяти и записываются одной транзакцией раз в flush_interval секунд
+    """
+
+    def __init__(self, db_path: Path, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self.flushes = 0
+
+        self._dirty: Dict[int, Optional[UserSession]] = {}  # None - сессия закрыта, запись удаляется
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # Стартовые сообщения с кнопками: переиспользуются вместо удаления и повторной отправки
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS start_messages ("
+            "channel_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL, content_hash TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        logger.info(f"SessionStore инициализирован: {db_path}, flush_interval={flush_interval}")
+
+    def stats(self) -> dict:
+        return {"pending": len(self._dirty), "writes": self.writes, "flushes": self.flushes}
+
+    def save(self, session: UserSession):
+        """Помечает сессию для записи при следующем сбросе на диск"""
+        self._dirty[session.user_id] = session if session.active else None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить сессии")
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        # Состояние снимается в потоке event loop, на диск пишет отдельный поток
+        now = time.time()
+        rows = [(user_id, json.dumps(s.to_state(), ensure_ascii=False), now)
+                for user_id, s in dirty.items() if s is not None]
+        deleted = [(user_id,) for user_id, s in dirty.items() if s is None]
+        try:
+            await asyncio.to_thread(self._write, rows, deleted)
+        except BaseException:
+            # Возвращаем несохраненное, не затирая более свежие изменения
+            for user_id, session in dirty.items():
+                self._dirty.setdefault(user_id, session)
+            raise
+
+    def _write(self, rows: List[tuple], deleted: List[tuple]):
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", rows)
+                self._db.executemany("DELETE FROM sessions WHERE user_id = ?", deleted)
+        self.writes += len(rows) + len(deleted)
+        self.flushes += 1
+
+    async def load(self) -> List[dict]:
+        """Состояния всех сохраненных сессий"""
+        rows = await asyncio.to_thread(self._read)
+        return [json.loads(state) for state in rows]
+
+    def _read(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT state FROM sessions")]
+
+    async def get_start_message(self, channel_id: int) -> Optional[Tuple[int, str]]:
+        """id стартового сообщения в канале и хэш его содержимого"""
+        return await asyncio.to_thread(self._get_start_message, channel_id)
+
+    def _get_start_message(self, channel_id: int) -> Optional[Tuple[int, str]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message_id, content_hash FROM start_messages WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    async def set_start_message(self, channel_id: int, message_id: int, content_hash: str):
+        await asyncio.to_thread(self._set_start_message, channel_id, message_id, content_hash)
+
+    def _set_start_message(self, channel_id: int, message_id: int, content_hash: str):
+        with self._lock:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO start_messages VALUES (?, ?, ?)",
+                                 (channel_id, message_id, content_hash))
+
+    async def close(self):
+        """Останавливает фоновую запись и сохраняет все накопленные изменения"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        with self._lock:
+            self._db.close()
+        logger.info(f"SessionStore закрыт: {self.stats()}")
@@ -1,75 +1,136 @@
-import asyncio
-from dataclasses import dataclass, field
-from typing import Optional, List
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional, List
 
 import discord
 
 from src.bot.ai_client import ReportCheckResult
-from src.utils.config_loader import bot_config, messages_config
+from src.bot.incremental import ReportBlock
+from src.bot.scheduler import TimerHandle, scheduler
+from src.utils import metrics
+from src.utils.config_registry import registry
 
 
 @dataclass
 class UserSession:
     user_id: int
-    checks_remaining: int = bot_config.bot.max_checks
+    checks_remaining: int = field(default_factory=lambda: registry.bot.bot.max_checks)
     last_result: Optional[ReportCheckResult] = None
+    report_blocks: List[ReportBlock] = field(default_factory=list)  # Прошлая версия отчета для повторной проверки
     active: bool = True
     processing: bool = False
     chat_history: List[dict] = field(default_factory=list)
-    timeout_task: Optional[asyncio.Task] = None
+    timeout_handle: Optional[TimerHandle] = None
     dm_channel: Optional[discord.abc.Messageable] = None  # discord.DMChannel для уведомления
     view: Optional[discord.ui.View] = None  # View для деактивации кнопок
+    on_close: Optional[Callable[["UserSession"], None]] = None  # Освобождение слота в SessionManager
+    opened_at: float = 0.0
+    report_type: str = field(default_factory=lambda: registry.bot.bot.report_type)
+    expires_at: float = 0.0  # Время срабатывания таймаута (time.time), нужно для восстановления после рестарта
+    view_message_id: Optional[int] = None  # Сообщение с результатом, кнопки которого нужно восстановить
+    on_change: Optional[Callable[["UserSession"], None]] = None  # Отложенная запись в SessionStore
+    dm_channel_id: Optional[int] = None  # id канала ЛС из сохраненного состояния
+
+    def to_state(self) -> dict:
+        """Состояние сессии для сохранения между перезапусками бота"""
+        # До открытия ЛС в dm_channel лежит пользователь, его id - не id канала
+        dm_channel_id = self.dm_channel_id
+        if isinstance(self.dm_channel, (discord.DMChannel, discord.PartialMessageable)):
+            dm_channel_id = self.dm_channel.id
+        return {
+            "user_id": self.user_id,
+            "checks_remaining": self.checks_remaining,
+            "report_type": self.report_type,
+            "chat_history": self.chat_history,
+            "last_result": asdict(self.last_result) if self.last_result else None,
+            "report_blocks": [asdict(b) for b in self.report_blocks],
+            "opened_at": time.time() - (time.monotonic() - self.opened_at),
+            "expires_at": self.expires_at,
+            "dm_channel_id": dm_channel_id,
+            "view_message_id": self.view_message_id,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "UserSession":
+        last_result = state["last_result"]
+        return cls(
+            user_id=state["user_id"],
+            checks_remaining=state["checks_remaining"],
+            report_type=state["report_type"],
+            chat_history=state["chat_history"],
+            last_result=ReportCheckResult.from_dict(last_result) if last_result else None,
+            report_blocks=[ReportBlock(**b) for b in state["report_blocks"]],
+            opened_at=time.monotonic() - (time.time() - state["opened_at"]),
+            expires_at=state["expires_at"],
+            view_message_id=state["view_message_id"],
+            dm_channel_id=state["dm_channel_id"],
+        )
+
+    def save(self):
+        if self.on_change:
+            self.on_change(self)
 
     def add_user_message(self, content: str):
         self.chat_history.append({"role": "user", "content": content})
 
-    def add_assistant_message(self, content: str):
-        self.chat_history.append({"role": "assistant", "content": content})
+    def add_assistant_message(self, content: str, summary: Optional[str] = None):
+        # summary заменяет полный ответ, когда история не влезает в бюджет токенов
+        self.chat_history.append({"role": "assistant", "content": content, "summary": summary})
 
     def can_check(self) -> bool:
         return self.active and self.checks_remaining > 0
 
-    def start_timeout(self, loop):
-        """Запускает таймаут сессии"""
-        if self.timeout_task and not self.timeout_task.done():
-            self.timeout_task.cancel()
-        self.timeout_task = loop.create_task(self._timeout_loop())
+    def close(self):
+        """Завершает сессию и освобождает слот (повторный вызов ничего не делает)"""
+        if not self.active:
+            return
+        self.active = False
+        self.cancel_timeout()
+        # История больше не понадобится, не держим ее в памяти до вытеснения сессии
+        self.chat_history = []
+        self.report_blocks = []
+        # View без таймаута остается в ViewStore бота вместе с результатом, пока его не остановят
+        if self.view:
+            self.view.stop()
+        if self.on_close:
+            self.on_close(self)
+        self.save()
+
+    def cancel_timeout(self):
+        if self.timeout_handle:
+            self.timeout_handle.cancel()
+            self.timeout_handle = None
 
-    def reset_timeout(self):
+    def reset_timeout(self, delay: Optional[float] = None):
         """Сбрасывает таймаут, только если нет активной проверки и есть проверки"""
         if self.active and self.checks_remaining > 0 and not self.processing:
-            loop = asyncio.get_event_loop()
-            self.start_timeout(loop)
-
-    async def _timeout_loop(self):
-        try:
-            await asyncio.sleep(bot_config.session.timeout)
-            # Ждём завершения текущей проверки
-            while self.processing:
-                await asyncio.sleep(5)
-
-            # Проверяем: если лимит проверок исчерпан, таймаут не нужен
-            if self.checks_remaining <= 0 or not self.active:
-                return
-
-            # Завершаем сессию
-            self.active = False
-
-            # Деактивируем кнопки View
-            if self.view:
-                self.view.stop()
-                for item in self.view.children:
-                    if isinstance(item, discord.ui.Button):
-                        item.disabled = True
-                try:
-                    # Обновляем сообщение с View, если возможно
-                    await self.view.message.edit(view=self.view)
-                except Exception:
-                    pass
-
-            if self.dm_channel:
-                await self.dm_channel.send(
-                    messages_config.message.session_closed_by_timeout.description.text
-                )
-        except asyncio.CancelledError:
-            pass
+            self.cancel_timeout()
+            delay = registry.bot.session.timeout if delay is None else delay
+            self.timeout_handle = scheduler.schedule(delay, self._on_timeout)
+            self.expires_at = time.time() + delay
+            self.save()
+
+    async def _on_timeout(self):
+        # Во время проверки таймаут не срабатывает - после нее он будет запущен заново
+        if self.processing or self.checks_remaining <= 0 or not self.active:
+            return
+
+        # Завершаем сессию
+        self.close()
+        metrics.timeouts_total.inc()
+
+        # Деактивируем кнопки View
+        if self.view:
+            for item in self.view.children:
+                if isinstance(item, discord.ui.Button):
+                    item.disabled = True
+            try:
+                # Обновляем сообщение с View, если возможно
+                await self.view.message.edit(view=self.view)
+            except Exception:
+                pass
+
+        if self.dm_channel:
+            await self.dm_channel.send(
+                registry.messages.session_closed_by_timeout.description.text
+            )
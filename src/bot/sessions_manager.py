@@ -1,24 +1,184 @@
 import asyncio
-from typing import Dict
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 
+from src.bot.scheduler import scheduler
+from src.bot.session_store import SessionStore
 from src.bot.sessions import UserSession
-from src.utils.config_loader import bot_config
+from src.utils import logger
+from src.utils.config_registry import registry
+
+logger = logger.get_logger("sessions_manager")
+
+
+@dataclass
+class QueuedUser:
+    user_id: int
+    guild_id: Optional[int]
+    dm_channel: object
+    enqueued_at: float
 
 
 class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[int, UserSession] = {}
+    def __init__(self, store: Optional[SessionStore] = None):
+        self.store = store
+
+        # Порядок вставки = порядок создания, при переполнении вытесняются самые старые неактивные
+        self.sessions: OrderedDict[int, UserSession] = OrderedDict()
+        self.active_count = 0
+
+        # Очередь на вход: по отдельной FIFO на гильдию, гильдии обслуживаются по кругу
+        self.queue: OrderedDict[Optional[int], Deque[QueuedUser]] = OrderedDict()
+        self.queued: Dict[int, QueuedUser] = {}
+        self.on_admit: Optional[Callable[[UserSession], Awaitable[None]]] = None
+
+        # Недавние длительности проверок и сессий для оценки времени ожидания
+        self.check_latencies: Deque[float] = deque(maxlen=50)
+        self.session_durations: Deque[float] = deque(maxlen=50)
 
     async def create_session(self, user_id: int, dm_channel=None) -> UserSession | None:
-        active_count = sum(1 for s in self.sessions.values() if s.active)
-        if active_count >= bot_config.session.max_active:
+        if self.active_count >= registry.bot.session.max_active or self.queued:
             return None
+        return self._open_session(user_id, dm_channel)
 
+    def get(self, user_id: int) -> UserSession | None:
+        return self.sessions.get(user_id)
+
+    def remove(self, user_id: int):
+        """Завершает (если нужно) и удаляет сессию пользователя"""
+        session = self.sessions.pop(user_id, None)
+        if session:
+            session.close()
+
+    def _open_session(self, user_id: int, dm_channel) -> UserSession:
         session = UserSession(user_id=user_id, dm_channel=dm_channel)
-        loop = asyncio.get_event_loop()
-        session.start_timeout(loop)
-        self.sessions[user_id] = session
+        session.opened_at = time.monotonic()
+        self._register(session)
+        session.reset_timeout()
         return session
 
-    def get(self, user_id: int) -> UserSession | None:
-        return self.sessions.get(user_id)
+    def _register(self, session: UserSession):
+        session.on_close = self._on_session_closed
+        if self.store:
+            session.on_change = self.store.save
+        self.sessions.pop(session.user_id, None)
+        self.sessions[session.user_id] = session
+        self.active_count += 1
+        self._enforce_limit()
+
+    async def restore(self, resolve_channel: Callable[[int], object]) -> List[UserSession]:
+        """
+        Восстанавливает активные сессии из хранилища после перезапуска. Таймаут продолжает
+        отсчитываться с момента последней активности, истекшие за время простоя сессии закрываются
+        """
+        if not self.store:
+            return []
+        restored = []
+        for state in await self.store.load():
+            session = UserSession.from_state(state)
+            if state["dm_channel_id"]:
+                session.dm_channel = resolve_channel(state["dm_channel_id"])
+            self._register(session)
+            remaining = session.expires_at - time.time()
+            if remaining <= 0:
+                session.close()
+                continue
+            session.reset_timeout(remaining)
+            restored.append(session)
+        logger.info(f"Восстановлено сессий после перезапуска: {len(restored)}")
+        return restored
+
+    def _on_session_closed(self, session: UserSession):
+        self.active_count -= 1
+        self.session_durations.append(time.monotonic() - session.opened_at)
+        scheduler.schedule(registry.bot.session.retention, lambda: self._evict(session))
+        self._admit_waiting()
+
+    def _evict(self, session: UserSession):
+        # Сессию могли уже заменить новой для того же пользователя
+        if self.sessions.get(session.user_id) is session and not session.active:
+            del self.sessions[session.user_id]
+            session.dm_channel = None
+            session.view = None
+
+    def _enforce_limit(self):
+        """Ограничивает число хранимых сессий, вытесняя самые старые неактивные"""
+        excess = len(self.sessions) - registry.bot.session.max_stored
+        if excess <= 0:
+            return
+        stale = [s for s in self.sessions.values() if not s.active][:excess]
+        for session in stale:
+            self._evict(session)
+
+    # ---------------- ОЧЕРЕДЬ ----------------
+    def record_check(self, latency: float):
+        self.check_latencies.append(latency)
+
+    def is_queued(self, user_id: int) -> bool:
+        return user_id in self.queued
+
+    def enqueue(self, user_id: int, guild_id: Optional[int], dm_channel) -> Tuple[int, float] | None:
+        """Ставит пользователя в очередь. Возвращает позицию и оценку ожидания в секундах"""
+        if user_id not in self.queued:
+            if len(self.queued) >= registry.bot.session.queue_size:
+                return None
+            waiter = QueuedUser(user_id, guild_id, dm_channel, time.monotonic())
+            self.queue.setdefault(guild_id, deque()).append(waiter)
+            self.queued[user_id] = waiter
+            logger.info(f"Пользователь {user_id} поставлен в очередь, в очереди: {len(self.queued)}")
+
+        position = self.position(user_id)
+        return position, self.estimate_wait(position)
+
+    def position(self, user_id: int) -> int:
+        """Позиция пользователя с учетом кругового обхода гильдий"""
+        queues = [list(q) for q in self.queue.values()]
+        position = 0
+        for depth in range(max(map(len, queues), default=0)):
+            for q in queues:
+                if depth < len(q):
+                    position += 1
+                    if q[depth].user_id == user_id:
+                        return position
+        return 0
+
+    def estimate_wait(self, position: int) -> float:
+        """Оценка ожидания: сколько "поколений" сессий должно смениться до входа пользователя"""
+        if self.session_durations:
+            hold = sum(self.session_durations) / len(self.session_durations)
+        elif self.check_latencies:
+            hold = registry.bot.bot.max_checks * sum(self.check_latencies) / len(self.check_latencies)
+        else:
+            hold = registry.bot.session.timeout
+        return math.ceil(position / registry.bot.session.max_active) * hold
+
+    def _next_waiter(self) -> QueuedUser | None:
+        while self.queue:
+            guild_id, q = next(iter(self.queue.items()))
+            waiter = q.popleft()
+            if q:
+                self.queue.move_to_end(guild_id)
+            else:
+                del self.queue[guild_id]
+            if self.queued.get(waiter.user_id) is waiter:
+                del self.queued[waiter.user_id]
+                return waiter
+        return None
+
+    def _admit_waiting(self):
+        while self.active_count < registry.bot.session.max_active:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            existing = self.sessions.get(waiter.user_id)
+            if existing and existing.active:
+                continue
+
+            session = self._open_session(waiter.user_id, waiter.dm_channel)
+            logger.info(f"Пользователь {waiter.user_id} допущен из очереди после "
+                        f"{time.monotonic() - waiter.enqueued_at:.0f} с ожидания")
+            if self.on_admit:
+                asyncio.get_event_loop().create_task(self.on_admit(session))
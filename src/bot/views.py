@@ -1,24 +1,162 @@
 import asyncio
+import io
 import logging
+from typing import List, Optional
 
 import discord
 
-from src.bot.ai_client import ReportCheckResult
+from src.bot.ai_client import ReportCheckResult, Recommendation
 from src.bot.sessions import UserSession
-from src.utils.config_loader import messages_config, bot_config
+from src.utils.config_registry import registry
 
 logger = logging.getLogger("views")
 
 
+class StreamingProgress:
+    """Обновляет сообщение о проверке по мере генерации рекомендаций, не чаще раза в interval секунд"""
+    MAX_LENGTH = 2000
+
+    def __init__(self, message: discord.Message, interval: Optional[float] = None):
+        self.message = message
+        self.interval = interval or registry.bot.ai.stream_edit_interval
+        self.recommendations: List[Recommendation] = []
+        self._rendered_count = 0
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._cancelled = False
+
+    def add(self, recommendation: Recommendation):
+        # После отмены сообщение уже занято ошибкой или результатом, поздние рекомендации не показываем
+        if self._cancelled:
+            return
+        self.recommendations.append(recommendation)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def render(self) -> str:
+        lines = [
+            registry.messages.check_started.description.text,
+            "",
+            registry.messages.check_progress.description.text,
+        ]
+        for rec in self.recommendations:
+            lines.append(f"🔍 **{rec.criterion}**")
+            lines.extend(f"• {i}" for i in rec.issues)
+
+        content = ""
+        for line in lines:
+            if len(content) + len(line) + 2 > self.MAX_LENGTH:
+                return content + "…"
+            content += line + "\n"
+        return content
+
+    async def _edit(self):
+        self._rendered_count = len(self.recommendations)
+        self._last_edit = asyncio.get_running_loop().time()
+        try:
+            await self.message.edit(content=self.render())
+        except discord.HTTPException:
+            logger.warning("Не удалось обновить сообщение о ходе проверки")
+
+    async def _run(self):
+        # Выдерживаем интервал между редактированиями, чтобы не упираться в rate limit Discord
+        while self._rendered_count < len(self.recommendations):
+            delay = self._last_edit + self.interval - asyncio.get_running_loop().time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._edit()
+
+    def cancel(self):
+        self._cancelled = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def flush(self):
+        """Останавливает отложенные обновления и выводит итоговое состояние"""
+        self.cancel()
+        if self._rendered_count < len(self.recommendations):
+            await self._edit()
+
+
+# Ограничения Discord на размер embed
+EMBED_FIELD_NAME_LIMIT = 256
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_FIELDS_LIMIT = 25
+EMBED_TOTAL_LIMIT = 6000
+FOOTER_RESERVE = 40  # "Страница N из M"
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _criterion_fields(rec: Recommendation) -> List[tuple]:
+    """Поля embed для критерия; слишком длинный список замечаний продолжается в следующих полях"""
+    lines = [_truncate(f"• {i}", EMBED_FIELD_VALUE_LIMIT) for i in rec.issues] or ["Нет замечаний"]
+    chunks, current = [], ""
+    for line in lines:
+        if current and len(current) + 1 + len(line) > EMBED_FIELD_VALUE_LIMIT:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    chunks.append(current)
+
+    name = f"🔍 {rec.criterion}"
+    return [(_truncate(name if i == 0 else f"{name} (продолжение)", EMBED_FIELD_NAME_LIMIT), chunk)
+            for i, chunk in enumerate(chunks)]
+
+
+def build_pages(result: ReportCheckResult, title: str, color: int, description: str,
+                page_size: int) -> List[discord.Embed]:
+    """
+    Раскладывает замечания по страницам: не больше page_size полей на страницу
+    и в пределах общего лимита размера embed
+    """
+    fields = [f for rec in result.recommendations for f in _criterion_fields(rec)]
+    budget = EMBED_TOTAL_LIMIT - len(title) - len(description) - FOOTER_RESERVE
+    limit = min(page_size, EMBED_FIELDS_LIMIT)
+
+    groups, current, size = [], [], 0
+    for name, value in fields:
+        if current and (len(current) >= limit or size + len(name) + len(value) > budget):
+            groups.append(current)
+            current, size = [], 0
+        current.append((name, value))
+        size += len(name) + len(value)
+    groups.append(current)
+
+    pages = []
+    for number, group in enumerate(groups, 1):
+        embed = discord.Embed(title=title, color=color, description=description)
+        for name, value in group:
+            embed.add_field(name=name, value=value, inline=False)
+        embed.set_footer(text=f"Страница {number} из {len(groups)}")
+        pages.append(embed)
+    return pages
+
+
 class ReportView(discord.ui.View):
+    """Результат проверки: страницы embed и файл с исправленным отчетом готовятся один раз при создании"""
+    FILENAME = "report_example.txt"
+
     def __init__(self, result: ReportCheckResult, session: UserSession):
         super().__init__(timeout=None)
         self.result = result
         self.session = session
         self.page = 0
         self.page_size = 5
-        self.total_pages = max(1, (len(result.recommendations) - 1) // self.page_size + 1)
-        self.timeout_task = asyncio.create_task(self._session_timeout())
+        check_result = registry.messages.check_result
+        self.pages = build_pages(
+            result,
+            title=_truncate(check_result.title.text, 256),
+            color=check_result.title.color,
+            description=f"{check_result.description.text} **{session.checks_remaining}**",
+            page_size=self.page_size,
+        )
+        self.total_pages = len(self.pages)
+        self.file_bytes = result.corrected_report.encode("utf-8")
+        self.message: Optional[discord.Message] = None
         self.update_buttons()
 
     # ---------------- ОБНОВЛЕНИЕ СОСТОЯНИЯ ----------------
@@ -31,104 +169,77 @@ class ReportView(discord.ui.View):
             if isinstance(child, discord.ui.Button) and child.custom_id == "finish":
                 child.disabled = not self.session.active
 
-    def make_embed(self):
-        embed = discord.Embed(
-            title=messages_config.message.check_result.title.text,
-            color=messages_config.message.check_result.title.color,
-            description=f"{messages_config.message.check_result.description.text} **{self.session.checks_remaining}**"
-        )
-        start = self.page * self.page_size
-        end = start + self.page_size
-        subset = self.result.recommendations[start:end]
-        for rec in subset:
-            issues = "\n".join([f"• {i}" for i in rec.issues])
-            embed.add_field(name=f"🔍 {rec.criterion}", value=issues or "Нет замечаний", inline=False)
-        embed.set_footer(text=f"Страница {self.page + 1} из {self.total_pages}")
-        return embed
+    async def retire(self):
+        """Предыдущий результат после новой проверки: View убирается из ViewStore, кнопки блокируются"""
+        self.stop()
+        for child in self.children:
+            if isinstance(child, discord.ui.Button):
+                child.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except Exception:
+            pass
+
+    def make_embed(self) -> discord.Embed:
+        return self.pages[self.page]
+
+    def make_file(self) -> discord.File:
+        """Файл с исправленным отчетом; discord.File одноразовый, поэтому создается на каждую отправку"""
+        return discord.File(io.BytesIO(self.file_bytes), filename=self.FILENAME)
 
     async def update_message(self, interaction: discord.Interaction):
-        self.update_buttons()
-        new_view = discord.ui.View()
-        for item in self.children:
-            new_view.add_item(item)
+        embed = self.pages[self.page]
         try:
-            await interaction.response.edit_message(embed=self.make_embed(), view=new_view)
+            await interaction.response.edit_message(embed=embed, view=self)
         except discord.errors.InteractionResponded:
-            await interaction.edit_original_response(embed=self.make_embed(), view=new_view)
+            await interaction.edit_original_response(embed=embed, view=self)
 
     # ---------------- НАВИГАЦИЯ ----------------
-    @discord.ui.button(label=messages_config.message.check_result.button.nav_back.label,
+    @discord.ui.button(label=registry.messages.check_result.button.nav_back.label,
                        style=discord.ButtonStyle.secondary, custom_id="prev")
     async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.page > 0:
             self.page -= 1
             await self.update_message(interaction)
 
-    @discord.ui.button(label=messages_config.message.check_result.button.nav_next.label,
+    @discord.ui.button(label=registry.messages.check_result.button.nav_next.label,
                        style=discord.ButtonStyle.secondary, custom_id="next")
     async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.page < self.total_pages - 1:
             self.page += 1
             await self.update_message(interaction)
 
+    # ---------------- ПОВТОРНАЯ ЗАГРУЗКА ----------------
+    @discord.ui.button(label=registry.messages.check_result.button.download.label,
+                       style=discord.ButtonStyle.secondary, custom_id="download")
+    async def download(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_message(file=self.make_file(), ephemeral=True)
+
     # ---------------- ЗАВЕРШЕНИЕ СЕССИИ ----------------
-    @discord.ui.button(label=messages_config.message.check_result.button.finish.label,
+    @discord.ui.button(label=registry.messages.check_result.button.finish.label,
                        style=discord.ButtonStyle.primary,
                        custom_id="finish")
     async def finish_session(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self._end_session(interaction, manual=True)
+        await self._end_session(interaction)
 
     # ---------------- ВНУТРЕННИЕ МЕТОДЫ ----------------
-    async def _end_session(self, interaction: discord.Interaction | None, manual=False):
+    async def _end_session(self, interaction: discord.Interaction):
+        """Завершение сессии кнопкой; по таймауту сессию завершает UserSession._on_timeout"""
         if not self.session.active:
             return
 
-        self.session.active = False
-
-        # Останавливаем таймер
-        if hasattr(self, "timeout_task") and self.timeout_task and not self.timeout_task.done():
-            self.timeout_task.cancel()
+        self.session.close()
 
         # Обновляем кнопки
         self.update_buttons()
-        new_view = discord.ui.View()
-        for item in self.children:
-            new_view.add_item(item)
-
-        # Обновляем сообщение, если interaction есть
-        if interaction is not None:
-            try:
-                await interaction.response.edit_message(view=new_view)
-            except discord.errors.InteractionResponded:
-                await interaction.edit_original_response(view=new_view)
+        try:
+            await interaction.response.edit_message(view=self)
+        except discord.errors.InteractionResponded:
+            await interaction.edit_original_response(view=self)
 
         # Отправляем уведомление пользователю
         try:
-            if manual:
-                if interaction is not None:
-                    await interaction.followup.send(
-                        messages_config.message.session_closed_ok.description.text,
-                        ephemeral=True
-                    )
-                else:
-                    await self.session.dm_channel.send(
-                        messages_config.message.session_closed_ok.description.text
-                    )
-                logger.info(f"Сессия пользователя {self.session.user_id} завершена вручную")
-            else:
-                await self.session.dm_channel.send(
-                    messages_config.message.session_closed_by_timeout.description.text
-                )
-                logger.info(f"Сессия пользователя {self.session.user_id} завершена по таймауту")
+            await interaction.followup.send(registry.messages.session_closed_ok.description.text, ephemeral=True)
+            logger.info(f"Сессия пользователя {self.session.user_id} завершена вручную")
         except Exception:
             logger.warning(f"Не удалось отправить уведомление пользователю {self.session.user_id}")
-
-    async def _session_timeout(self):
-        try:
-            await asyncio.sleep(bot_config.session.timeout)
-
-            # Сессия активна и не в процессе обработки
-            if self.session.active and not self.session.processing:
-                await self._end_session(interaction=None, manual=False)
-        except asyncio.CancelledError:
-            return  # Таймер сброшен
@@ -0,0 +1,281 @@
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.bot.ai_client import AIClient, Recommendation, ReportCheckResult
+from src.bot.incremental import IncrementalChecker, ReportBlock
+from src.bot.sections import SectionChecker
+from src.utils import logger
+from src.utils import metrics
+from src.utils.config_registry import registry
+from src.utils.logger import listen_worker_logs, request_id, use_parent_logging
+
+logger = logger.get_logger("workers")
+
+# spawn: дочерний процесс не наследует event loop, потоки и соединения основного процесса
+_context = multiprocessing.get_context("spawn")
+
+
+class CheckWorkerError(Exception):
+    """Ошибка проверки в процессе-обработчике или его аварийное завершение"""
+
+
+@dataclass
+class _PendingJob:
+    future: asyncio.Future
+    on_recommendation: Optional[Callable[[Recommendation], None]]
+    worker: Optional[int] = None  # номер процесса, взявшего задание
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: multiprocessing.Process
+    jobs: set = field(default_factory=set)
+
+
+class CheckWorkerPool:
+    """
+    Пул процессов для проверки отчетов. У каждого процесса свой event loop, AIClient и IncrementalChecker,
+    задания берутся из общей очереди, а рекомендации и результаты возвращаются через очередь событий.
+    Интерфейс совпадает с IncrementalChecker.check, поэтому пул подставляется вместо него в handlers
+    """
+
+    def __init__(self, processes: int, env_path: Path, report_type: str, max_concurrent: int,
+                 job_timeout: float, client_options: Optional[dict] = None):
+        self.processes = processes
+        # Процесс может погибнуть до того, как основной процесс узнает, что он взял задание:
+        # такое задание не завершится само, поэтому ожидание результата ограничено
+        self.job_timeout = job_timeout
+        # Окно параллельных запросов к модели делится между процессами поровну с округлением вниз,
+        # поэтому суммарно не больше max_concurrent (если процессов не больше max_concurrent)
+        self.worker_concurrency = max(1, max_concurrent // processes)
+        self._worker_args = (env_path, report_type, self.worker_concurrency, client_options or {})
+
+        self._jobs = _context.Queue()
+        self._events = _context.Queue()
+        self._logs = _context.Queue()
+        self._workers: Dict[int, _Worker] = {}
+        self._pending: Dict[int, _PendingJob] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._log_listener = None
+        self._closing = False
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        return {"processes": self.processes, "in_flight": self.in_flight, "completed": self.completed,
+                "failed": self.failed, "restarts": self.restarts}
+
+    def start(self):
+        if self._reader:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._log_listener = listen_worker_logs(self._logs)
+        for index in range(self.processes):
+            self._spawn(index)
+        self._reader = threading.Thread(target=self._read_events, name="check-workers", daemon=True)
+        self._reader.start()
+        logger.info(f"Запущен пул проверок: процессов {self.processes}, "
+                    f"параллельных запросов на процесс {self.worker_concurrency}")
+
+    def _spawn(self, index: int):
+        process = _context.Process(target=_worker_main, name=f"check-worker-{index}",
+                                   args=(index, self._jobs, self._events, self._logs, *self._worker_args),
+                                   daemon=True)
+        process.start()
+        self._workers[index] = _Worker(index, process)
+
+    # ---------------- СОБЫТИЯ ОТ ПРОЦЕССОВ ----------------
+    def _read_events(self):
+        """Поток чтения событий: передает их в event loop и следит, что процессы живы"""
+        checked_at = time.monotonic()
+        while True:
+            try:
+                event = self._events.get(timeout=1)
+            except queue.Empty:
+                event = ()
+            if event is None:
+                return
+            if event:
+                self._loop.call_soon_threadsafe(self._dispatch, *event)
+            if time.monotonic() - checked_at >= 1:
+                checked_at = time.monotonic()
+                self._loop.call_soon_threadsafe(self._check_workers)
+
+    def _dispatch(self, job_id: Optional[int], kind: str, payload):
+        if kind == "metrics":
+            metrics.merge(payload)
+            return
+        pending = self._pending.get(job_id)
+        if kind == "started":
+            if pending:
+                pending.worker = payload
+                self._workers[payload].jobs.add(job_id)
+        elif kind == "recommendation":
+            if pending and pending.on_recommendation:
+                pending.on_recommendation(payload)
+        elif kind == "result":
+            self.completed += 1
+            self._finish(job_id, result=payload)
+        else:
+            self.failed += 1
+            self._finish(job_id, error=CheckWorkerError(payload))
+
+    def _finish(self, job_id: int, result=None, error: Optional[Exception] = None):
+        for worker in self._workers.values():
+            worker.jobs.discard(job_id)
+        # Ожидающего может уже не быть: проверку отменили, пока она шла в процессе
+        pending = self._pending.pop(job_id, None)
+        if pending is None or pending.future.done():
+            return
+        if error:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(result)
+
+    def _check_workers(self):
+        """Завершившийся аварийно процесс перезапускается, его задания завершаются ошибкой"""
+        if self._closing:
+            return
+        for index, worker in list(self._workers.items()):
+            if worker.process.is_alive():
+                continue
+            logger.error(f"Процесс проверки {worker.process.name} завершился с кодом {worker.process.exitcode}, "
+                         f"потеряно заданий: {len(worker.jobs)}")
+            for job_id in list(worker.jobs):
+                self.failed += 1
+                self._finish(job_id, error=CheckWorkerError("процесс проверки аварийно завершился"))
+            self.restarts += 1
+            self._spawn(index)
+
+    # ---------------- ПРОВЕРКА ----------------
+    async def check(
+            self,
+            report: str,
+            previous_blocks: Optional[List[ReportBlock]] = None,
+            previous_result: Optional[ReportCheckResult] = None,
+            history: Optional[List[dict]] = None,
+            report_type: Optional[str] = None,
+            findings: Optional[List[Recommendation]] = None,
+            on_recommendation: Optional[Callable[[Recommendation], None]] = None,
+    ) -> Tuple[ReportCheckResult, List[ReportBlock]]:
+        """То же, что IncrementalChecker.check, но в одном из процессов пула"""
+        if self._loop is None:
+            raise RuntimeError("Пул проверок не запущен")
+        job_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[job_id] = _PendingJob(future, on_recommendation)
+        self._jobs.put((job_id, request_id.get(), {
+            "report": report,
+            "previous_blocks": previous_blocks,
+            "previous_result": previous_result,
+            "history": history,
+            "report_type": report_type,
+            "findings": findings,
+            "stream": on_recommendation is not None,
+        }))
+        try:
+            return await asyncio.wait_for(future, self.job_timeout)
+        except asyncio.TimeoutError:
+            self.failed += 1
+            logger.error(f"Проверка {job_id} не завершилась за {self.job_timeout} с")
+            raise CheckWorkerError("проверка в пуле процессов не завершилась вовремя") from None
+        finally:
+            self._pending.pop(job_id, None)
+            for worker in self._workers.values():
+                worker.jobs.discard(job_id)
+
+    async def close(self, grace: float = 5):
+        """Останавливает прием заданий, дает начатым проверкам grace секунд и завершает процессы"""
+        if self._reader is None:
+            return
+        self._closing = True
+        for _ in self._workers:
+            self._jobs.put(None)
+        processes = [w.process for w in self._workers.values()]
+        deadline = time.monotonic() + grace
+        await asyncio.to_thread(lambda: [p.join(timeout=max(0.0, deadline - time.monotonic())) for p in processes])
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        self._events.put(None)
+        await asyncio.to_thread(self._reader.join)
+        self._reader = None
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(CheckWorkerError("пул проверок остановлен"))
+        self._log_listener.stop()
+        logger.info(f"Пул проверок остановлен: {self.stats()}")
+
+
+# ---------------- ПРОЦЕСС-ОБРАБОТЧИК ----------------
+def _worker_main(index: int, jobs, events, logs, env_path: Path, report_type: str, max_concurrent: int,
+                 client_options: dict):
+    use_parent_logging(logs)
+    try:
+        asyncio.run(_serve(index, jobs, events, env_path, report_type, max_concurrent, client_options))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(index: int, jobs, events, env_path: Path, report_type: str, max_concurrent: int,
+                 client_options: dict):
+    client = AIClient(env_path, report_type=report_type, max_concurrent=max_concurrent, **client_options)
+    section_checker = None
+    if registry.bot.sections.enabled:
+        section_checker = SectionChecker(client, min_chars=registry.bot.sections.min_chars,
+                                         target_chars=registry.bot.sections.target_chars,
+                                         max_sections=registry.bot.sections.max_sections)
+    checker = IncrementalChecker(client, section_checker, max_changed_ratio=registry.bot.incremental.max_changed_ratio)
+    # Промпты и конфиги перечитываются в каждом процессе
+    watcher = asyncio.create_task(registry.watch(registry.bot.bot.config_reload_interval))
+
+    # Процесс берет новое задание, только когда у него есть свободное место, остальные достаются соседям
+    slots = asyncio.Semaphore(max_concurrent)
+    tasks = set()
+    while True:
+        await slots.acquire()
+        job = await asyncio.to_thread(jobs.get)
+        if job is None:
+            break
+        task = asyncio.create_task(_run_job(index, checker, events, *job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    watcher.cancel()
+    await client.close()
+    events.put((None, "metrics", metrics.collect()))
+
+
+async def _run_job(index: int, checker: IncrementalChecker, events, job_id: int, job_request_id: str, job: dict):
+    request_id.set(job_request_id)
+    events.put((job_id, "started", index))
+    stream = job.pop("stream")
+    try:
+        result = await checker.check(
+            **job,
+            on_recommendation=(lambda rec: events.put((job_id, "recommendation", rec))) if stream else None,
+        )
+        # Метрики, собранные в процессе (ожидание окна, запрос, разбор, токены), отдает основной процесс
+        events.put((None, "metrics", metrics.collect()))
+        events.put((job_id, "result", result))
+    except Exception as e:
+        logger.exception("Ошибка проверки в процессе пула")
+        events.put((None, "metrics", metrics.collect()))
+        events.put((job_id, "error", str(e)))
@@ -1,8 +1,9 @@
 import os
 
-from src.bot.report_bot import bot
-
 if __name__ == "__main__":
+    # Импорт внутри: процессы пула проверок (spawn) импортируют этот модуль заново и не должны создавать бота
+    from src.bot.report_bot import bot
+
     token = os.getenv("DISCORD_TOKEN")
     if not token:
         raise ValueError("DISCORD_TOKEN не найден в .env")
@@ -0,0 +1,181 @@
+"""
+Скомпилированные конфиги и промпты с горячей перезагрузкой.
+
+messages_config.yaml и bot_config.yaml один раз разбираются в неизменяемые структуры из
+обычных dict/tuple, поэтому на горячих путях нет обращений к Dynaconf. Промпты хранятся
+по типу отчета (имя файла без расширения) и уже содержат base_rules.txt.
+
+Новая версия собирается целиком и подменяет текущую одним присваиванием: обработчики,
+которые уже взяли снимок, дорабатывают со старым, сессии при этом не теряются.
+"""
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Mapping
+
+from dynaconf import Dynaconf
+
+from src.utils import logger
+from src.utils.config_loader import CONFIGS_BASE_DIR, PROMPTS_BASE_DIR
+
+logger = logger.get_logger("config_registry")
+
+BASE_RULES_PROMPT = "base_rules"
+
+
+class FrozenConfig(Mapping):
+    """Неизменяемый узел конфига с доступом через атрибуты, как у Dynaconf"""
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Mapping[str, Any]):
+        object.__setattr__(self, "_data", MappingProxyType({k: freeze(v) for k, v in data.items()}))
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Конфиг доступен только для чтения")
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"FrozenConfig({dict(self._data)!r})"
+
+
+def freeze(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return FrozenConfig(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _merge(base: dict, override: Mapping) -> dict:
+    result = dict(base)
+    for key, value in override.items():
+        if isinstance(value, Mapping) and isinstance(result.get(key), Mapping):
+            result[key] = _merge(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def _load_yaml(path: Path) -> dict:
+    # Тот же загрузчик, что и в config_loader, чтобы значения совпадали с Dynaconf
+    return {k.lower(): v for k, v in Dynaconf(settings_files=[str(path)]).as_dict().items()}
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    bot: FrozenConfig
+    messages: FrozenConfig
+    prompts: Mapping[str, str]
+
+
+class ConfigRegistry:
+    def __init__(self, configs_dir: Path = CONFIGS_BASE_DIR, prompts_dir: Path = PROMPTS_BASE_DIR):
+        self.configs_dir = configs_dir
+        self.prompts_dir = prompts_dir
+        self.on_reload: List[Callable[[ConfigSnapshot], None]] = []
+        self._overrides: dict = {}
+        self._mtimes = self._scan()
+        self._snapshot = self._compile(version=1)
+
+    # ---------------- ТЕКУЩАЯ ВЕРСИЯ ----------------
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return self._snapshot
+
+    @property
+    def bot(self) -> FrozenConfig:
+        return self._snapshot.bot
+
+    @property
+    def messages(self) -> FrozenConfig:
+        return self._snapshot.messages
+
+    @property
+    def prompts(self) -> Mapping[str, str]:
+        return self._snapshot.prompts
+
+    def role_prompt(self, report_type: str) -> str:
+        """Системный промпт для типа отчета вместе с общими правилами"""
+        try:
+            return self._snapshot.prompts[report_type]
+        except KeyError:
+            raise KeyError(f"Промпт для типа отчета не найден: {report_type}") from None
+
+    # ---------------- СБОРКА ----------------
+    def _watched_files(self) -> List[Path]:
+        return [self.configs_dir / "bot_config.yaml", self.configs_dir / "messages_config.yaml",
+                *sorted(self.prompts_dir.glob("*.txt"))]
+
+    def _scan(self) -> Dict[Path, int]:
+        return {path: path.stat().st_mtime_ns for path in self._watched_files() if path.exists()}
+
+    def _compile(self, version: int) -> ConfigSnapshot:
+        bot = _merge(_load_yaml(self.configs_dir / "bot_config.yaml"), self._overrides)
+        messages = _load_yaml(self.configs_dir / "messages_config.yaml")["message"]
+
+        texts = {path.stem: path.read_text(encoding="utf-8").strip() for path in self.prompts_dir.glob("*.txt")}
+        base_rules = texts.pop(BASE_RULES_PROMPT, "")
+        if not texts:
+            raise FileNotFoundError(f"В {self.prompts_dir} нет ни одного промпта")
+        prompts = {name: f"{text}\n\n---\n\n{base_rules}" for name, text in texts.items()}
+
+        return ConfigSnapshot(version, FrozenConfig(bot), FrozenConfig(messages), MappingProxyType(prompts))
+
+    def _swap(self, snapshot: ConfigSnapshot):
+        self._snapshot = snapshot
+        logger.info(f"Загружена версия конфига {snapshot.version}, промпты: {sorted(snapshot.prompts)}")
+        for callback in self.on_reload:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("Ошибка в обработчике перезагрузки конфига")
+
+    def reload(self) -> bool:
+        """Пересобирает конфиг. При ошибке в файлах остается предыдущая версия"""
+        self._mtimes = self._scan()
+        try:
+            snapshot = self._compile(self._snapshot.version + 1)
+        except Exception:
+            logger.exception("Не удалось перезагрузить конфиг, используется предыдущая версия")
+            return False
+        self._swap(snapshot)
+        return True
+
+    def override(self, values: Mapping):
+        """Поверх bot_config.yaml подставляет значения, которые сохраняются и после перезагрузки"""
+        self._overrides = _merge(self._overrides, values)
+        self._swap(self._compile(self._snapshot.version + 1))
+
+    async def watch(self, interval: float):
+        """Следит за временем изменения файлов и подменяет конфиг без перезапуска бота"""
+        while True:
+            await asyncio.sleep(interval)
+            mtimes = await asyncio.to_thread(self._scan)
+            if mtimes == self._mtimes:
+                continue
+            self._mtimes = mtimes
+            try:
+                snapshot = await asyncio.to_thread(self._compile, self._snapshot.version + 1)
+            except Exception:
+                logger.exception("Не удалось перезагрузить конфиг, используется предыдущая версия")
+                continue
+            self._swap(snapshot)
+
+
+registry = ConfigRegistry()
@@ -1,5 +1,11 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from src.utils.config_loader import logger_config, SRC_BASE_DIR
 
@@ -11,22 +17,106 @@ logging.getLogger("discord.http").setLevel(logging.WARNING)
 LOG_DIR = (SRC_BASE_DIR / "logs")
 LOG_DIR.mkdir(exist_ok=True)
 
+# Идентификатор текущего запроса (проверки отчета), попадает в каждую запись лога
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+
+def new_request_id(prefix: str) -> str:
+    """Создает и устанавливает идентификатор запроса для текущего контекста"""
+    value = f"{prefix}-{uuid.uuid4().hex[:8]}"
+    request_id.set(value)
+    return value
+
+
+TRUNCATED_MARK = "... [обрезано "  # отметка сообщения, обрезанного до max_message_length
+_exception_formatter = logging.Formatter()
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования и записи на диск в потоке event loop.
+    Сообщение собирается один раз и обрезается до max_message_length
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_message_length: int):
+        super().__init__(log_queue)
+        self.max_message_length = max_message_length
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        message = record.getMessage()
+        if len(message) > self.max_message_length:
+            message = (f"{message[:self.max_message_length]}{TRUNCATED_MARK}"
+                       f"{len(message) - self.max_message_length} символов]")
+        record.msg = message
+        record.args = None
+        record.request_id = request_id.get()
+        # traceback не сериализуется: в очередь между процессами уходит уже отформатированный текст
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+_file_handler = RotatingFileHandler(
+    LOG_DIR / "app.log",
+    maxBytes=5 * 1024 * 1024,  # 5 MB
+    backupCount=3,  # храним 3 файла максимум
+    encoding="utf-8"
+)  # Запись в файл
+if logger_config.logging.json:
+    _file_handler.setFormatter(JsonFormatter(datefmt=logger_config.logging.datefmt))
+else:
+    _file_handler.setFormatter(logging.Formatter(logger_config.logging.format, logger_config.logging.datefmt))
+
+# Запись на диск и ротация выполняются в отдельном потоке QueueListener
+_log_queue: queue.Queue = queue.Queue()
+_listener = QueueListener(
+    _log_queue,
+    _file_handler,
+    # logging.StreamHandler(sys.stdout),  # Вывод в консоль
+    respect_handler_level=True,
+)
+_listener.start()
+atexit.register(_listener.stop)
+
 logging.basicConfig(
     level=logger_config.logging.level,
-    format=logger_config.logging.format,
-    datefmt=logger_config.logging.datefmt,
-    handlers=[
-        # logging.StreamHandler(sys.stdout),  # Вывод в консоль
-        RotatingFileHandler(
-            LOG_DIR / "app.log",
-            maxBytes=5 * 1024 * 1024,  # 5 MB
-            backupCount=3,  # храним 3 файла максимум
-            encoding="utf-8"
-        ),  # Запись в файл
-    ],
+    handlers=[_ContextQueueHandler(_log_queue, logger_config.logging.max_message_length)],
 )
 
 
 def get_logger(name: str) -> logging.Logger:
     """Возвращает сконфигурированный логгер с единым форматом"""
     return logging.getLogger(name)
+
+
+def listen_worker_logs(log_queue) -> QueueListener:
+    """Пишет в общий файл записи дочерних процессов: файлом и его ротацией владеет только основной процесс"""
+    listener = QueueListener(log_queue, _file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def use_parent_logging(log_queue):
+    """Перенаправляет логи дочернего процесса в очередь основного процесса"""
+    atexit.unregister(_listener.stop)
+    _listener.stop()
+    _file_handler.close()
+    logging.root.handlers = [_ContextQueueHandler(log_queue, logger_config.logging.max_message_length)]
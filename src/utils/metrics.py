@@ -0,0 +1,199 @@
+import bisect
+import contextvars
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from src.utils import logger
+
+logger = logger.get_logger("metrics")
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[self._key(labels)] += amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение берется из функции в момент чтения метрик"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, getter: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.getter = getter
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {self.getter()}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def collect() -> dict:
+    """
+    Приращения счетчиков и гистограмм с прошлого вызова: дочерний процесс передает их основному,
+    который отдает /metrics
+    """
+    delta = {}
+    for metric in _registry:
+        if isinstance(metric, Counter) and metric.values:
+            delta[metric.name] = dict(metric.values)
+            metric.values.clear()
+        elif isinstance(metric, Histogram) and metric.counts:
+            delta[metric.name] = {key: (counts, metric.sums[key]) for key, counts in metric.counts.items()}
+            metric.counts.clear()
+            metric.sums.clear()
+    return delta
+
+
+def merge(delta: dict):
+    """Добавляет приращения из дочернего процесса к метрикам этого процесса"""
+    metrics = {metric.name: metric for metric in _registry}
+    for name, values in delta.items():
+        metric = metrics.get(name)
+        if isinstance(metric, Counter):
+            for key, value in values.items():
+                metric.values[key] += value
+        elif isinstance(metric, Histogram):
+            for key, (counts, total) in values.items():
+                current = metric.counts.setdefault(key, [0] * (len(metric.buckets) + 1))
+                for i, count in enumerate(counts):
+                    current[i] += count
+                metric.sums[key] += total
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- МЕТРИКИ ПРОВЕРОК ----------------
+stage_seconds = Histogram(
+    "report_check_stage_seconds",
+    "Длительность этапов проверки отчета: attachment, queue_wait, upstream, parse, discord_send",
+    labels=("stage",),
+)
+checks_total = Counter("report_checks_total", "Проверки отчетов по результату (ok, cached, blocked, rejected, error)", ("status",))
+rejections_total = Counter("report_session_rejections_total", "Отказы в создании сессии", ("reason",))
+timeouts_total = Counter("report_session_timeouts_total", "Сессии, завершенные по таймауту")
+parse_failures_total = Counter("report_parse_failures_total", "Ответы модели, которые не удалось разобрать")
+parse_repairs_total = Counter("report_parse_repairs_total", "Ответы модели, разобранные после исправления ошибок")
+tokens_total = Counter("report_tokens_total", "Токены по данным API (prompt, completion)", ("kind", "model"))
+
+# ---------------- ТРАССИРОВКА ----------------
+_current_trace: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(name: str, trace_id: Optional[str] = None) -> dict:
+    """Начинает трассировку запроса: все span внутри текущего контекста попадут в нее"""
+    trace = {"id": trace_id or uuid.uuid4().hex[:12], "name": name, "spans": []}
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: dict):
+    spans = ", ".join(f"{stage}={duration * 1000:.0f}мс" for stage, duration in trace["spans"])
+    logger.info(f"Трасса {trace['name']} [{trace['id']}]: {spans}")
+
+
+@contextmanager
+def span(stage: str):
+    """Замеряет этап проверки в гистограмме и, если идет трассировка, добавляет его в трассу"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        stage_seconds.observe(duration, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["spans"].append((stage, duration))
+
+
+# ---------------- HTTP ----------------
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает локальный эндпоинт /metrics в текстовом формате Prometheus"""
+
+    async def handle(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
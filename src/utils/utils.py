@@ -1,16 +1,134 @@
 import json
+import math
 import re
+from typing import List, Optional
 
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_OBJECT_START_RE = re.compile(r'\{\s*["}]')
+_JSON_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]', re.DOTALL)  # строка целиком или скобка
+_TRAILING_COMMA_RE = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")|,(\s*[}\]])', re.DOTALL)
 
-def extract_json(raw_text: str) -> dict:
-    """Извлекает JSON-объект из текста, даже если вокруг есть текст"""
-    match = re.search(r"\{.*}", raw_text, re.DOTALL)
-    if not match:
-        raise ValueError("Не удалось найти JSON в переданном тексте")
-    json_str = match.group(0)
-    try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Ошибка парсинга JSON: {e}\n"
-                         f"Сырой текст:\n"
-                         f"{raw_text[:500]}")
+
+def find_json_object(text: str) -> Optional[str]:
+    """
+    Первый сбалансированный JSON-объект в тексте за один линейный проход. Скобки внутри строк
+    не учитываются, поэтому текст и markdown-разметка вокруг объекта не мешают разбору.
+    None - объекта нет или он оборван
+    """
+    start = _OBJECT_START_RE.search(text)
+    if not start:
+        return None
+    depth = 0
+    for match in _JSON_TOKEN_RE.finditer(text, start.start()):
+        ch = match.group()
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start.start():match.end()]
+    return None
+
+
+def repair_json(json_str: str) -> str:
+    """Убирает висячие запятые перед } и ] вне строк"""
+    return _TRAILING_COMMA_RE.sub(lambda m: m.group(1) or m.group(2), json_str)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Локальная оценка числа токенов без токенизатора модели:
+    знак препинания - один токен, слово - примерно по токену на каждые 3 символа
+    """
+    tokens = 0
+    for match in _TOKEN_RE.finditer(text):
+        tokens += math.ceil(len(match.group(0)) / 3)
+    return tokens
+
+
+def estimate_messages_tokens(messages: List[dict]) -> int:
+    # +4 на служебную разметку каждого сообщения
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+class IncrementalJSONParser:
+    """
+    Потоковый разбор ответа модели: принимает куски текста и возвращает объекты
+    из массива recommendations сразу после закрытия каждого из них
+    """
+
+    def __init__(self, array_key: str = "recommendations"):
+        self.array_key = array_key
+        self._text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key = None
+        self._current_array = None
+        self._item_start = None
+        self._done = False  # корневой объект закрыт
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Добавляет кусок текста и возвращает завершенные элементы массива"""
+        if not chunk:
+            return []
+        self._text += chunk
+        if self._done:
+            # Текст после корневого объекта (пояснения, пример формата) не разбираем
+            return []
+        items = []
+        text = self._text
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+
+            if not self._stack:
+                # Пропускаем текст до начала корневого объекта
+                if ch == "{":
+                    self._stack.append("{")
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == "[":
+                if len(self._stack) == 1:
+                    self._current_array = self._last_key
+                self._stack.append("[")
+            elif ch == "{":
+                if len(self._stack) == 2 and self._current_array == self.array_key:
+                    self._item_start = i
+                self._stack.append("{")
+            elif ch in "]}":
+                self._stack.pop()
+                if ch == "}" and len(self._stack) == 2 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(text[self._item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass  # Битый элемент будет обнаружен при финальном разборе
+                    self._item_start = None
+                if not self._stack:
+                    # Корневой объект закрыт, остальной текст не разбираем
+                    self._done = True
+                    self._pos = len(text)
+                    return items
+
+        self._pos = len(text)
+        return items